@@ -0,0 +1,85 @@
+"""Measure the unique memory of pre-forked workers using the bundled data.
+
+Usage
+-----
+
+.. code-block:: shell
+
+    $ python benchmarks/fork.py --workers 8
+    $ python benchmarks/fork.py --workers 8 --preload
+"""
+
+import argparse
+import os
+import pathlib
+import sys
+
+
+sys.path.insert(0, os.fspath(pathlib.Path(__file__).parent.parent / 'python'))
+
+
+import python_environments  # noqa: E402
+import python_environments._init  # noqa: E402
+
+
+def unique_memory() -> int:
+    """Unique set size (private pages) of the current process, in bytes."""
+    total = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                total += int(line.split()[1]) * 1024
+    return total
+
+
+def _walk(value: object) -> None:
+    if isinstance(value, str):
+        return
+    if hasattr(value, 'values'):
+        for item in value.values():
+            _walk(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _walk(item)
+
+
+def _worker(write_fd: int) -> None:
+    before = unique_memory()
+    for name in python_environments._init._image_names():
+        _walk(python_environments.get(name))
+    after = unique_memory()
+    os.write(write_fd, f'{before} {after}\n'.encode())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--preload', action='store_true')
+    args = parser.parse_args()
+
+    if args.preload:
+        python_environments.preload()
+
+    read_fd, write_fd = os.pipe()
+    pids = []
+    for _ in range(args.workers):
+        if (pid := os.fork()) == 0:
+            try:
+                _worker(write_fd)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    os.close(write_fd)
+
+    with os.fdopen(read_fd) as f:
+        results = [tuple(map(int, line.split())) for line in f]
+    for i, (before, after) in enumerate(results):
+        print(f'worker {i}: {before / 1024:.0f} KiB -> {after / 1024:.0f} KiB unique memory')
+    average = sum(after for _, after in results) / len(results)
+    print(f'average: {average / 1024:.0f} KiB unique memory after loading (preload={args.preload})')
+
+
+if __name__ == '__main__':
+    main()
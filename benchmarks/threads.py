@@ -0,0 +1,71 @@
+"""Measure the latency of concurrent first calls to python_environments.get().
+
+Usage
+-----
+
+.. code-block:: shell
+
+    $ python benchmarks/threads.py --threads 16 debian:12
+"""
+
+import argparse
+import os
+import pathlib
+import statistics
+import sys
+import threading
+import time
+
+
+sys.path.insert(0, os.fspath(pathlib.Path(__file__).parent.parent / 'python'))
+
+
+import python_environments  # noqa: E402
+
+
+def run(name: str, threads: int) -> list[float]:
+    python_environments.clear_cache()
+    barrier = threading.Barrier(threads)
+    latencies = [0.0] * threads
+    images = [None] * threads
+
+    def worker(i: int) -> None:
+        barrier.wait()
+        start = time.perf_counter()
+        images[i] = python_environments.get(name)
+        latencies[i] = time.perf_counter() - start
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    assert all(image is images[0] for image in images), 'threads got different ImageData objects'
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=os.cpu_count())
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('image')
+    args = parser.parse_args()
+
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f'{args.threads} threads, {args.rounds} rounds, GIL {"enabled" if gil else "disabled"}')
+
+    latencies = []
+    misses = python_environments.cache_info().misses
+    for _ in range(args.rounds):
+        latencies += run(args.image, args.threads)
+    loads = python_environments.cache_info().misses - misses
+
+    latencies.sort()
+    print(f'loads: {loads} (expected {args.rounds})')
+    print(f'first-call latency: median {statistics.median(latencies) * 1e3:.3f} ms, '
+          f'p99 {latencies[int(len(latencies) * 0.99)] * 1e3:.3f} ms, max {latencies[-1] * 1e3:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,48 @@
 import argparse
+import asyncio
+import concurrent.futures
+import functools
 import itertools
+import json
+import os
 import pathlib
+import re
+import subprocess
+import sys
+import time
 
-from collections.abc import Iterator
+from collections.abc import Collection
+from typing import Any, NamedTuple
 
 import containers
 import containers.concurrent
 import containers.env
+import containers.manifest
 import containers.ops
 
 
+GENERATE_DATA_SCRIPT_PATH = containers.PYTHON_PATH / 'generate-data.py'
+# Characters not allowed in bake target names and image tags (used for the cache scopes)
+SLUG_INVALID_CHARS_REGEX = re.compile(r'[^a-zA-Z0-9_-]')
+
+
+class Step(NamedTuple):
+    action: str
+    target: str
+
+    def __str__(self) -> str:
+        return f'{self.action} {self.target}'
+
+
+class Decision(NamedTuple):
+    #: build, tag (only add the new tags to the existing image) or skip
+    action: str
+    reason: str
+    manifest: containers.manifest.ImageManifest
+    #: Tags to add to the existing image (tag)
+    new_tags: tuple[str, ...] = ()
+
+
 class Builder:
     def __init__(
         self,
@@ -17,17 +50,68 @@ class Builder:
         repos: list[containers.Repo],
         srcdir: pathlib.Path,
         logdir: pathlib.Path,
+        use_asyncio: bool = False,
+        manifest: containers.manifest.BuildManifest | None = None,
+        caches: Collection[containers.ops.BuildCache] = (),
+        console: containers.ops.Console | None = None,
     ) -> None:
         self._images = images
         self._repos = repos
         self._srcdir = srcdir
         self._logdir = logdir
+        self._use_asyncio = use_asyncio
+        self._manifest = manifest
+        self._caches = caches
+        self._console = console
         self._env_info = containers.env.environment_info()
+        # Used to get the commands, which are run by the task runner, and to inspect images when planning
+        # (which needs the whole output, and where failures are expected, eg. for images not built yet)
+        runner = functools.partial(subprocess.check_output, stderr=subprocess.DEVNULL)
+        self._docker_client = containers.ops.DockerClient(runner)
+        self._decisions: dict[str, Decision] = {}
+        self._image_tasks: dict[str, list[containers.concurrent.Task[Step]]] = {}
+
+    def _runner(
+        self,
+        logfile: pathlib.Path,
+        name: str,
+    ) -> containers.ops.SubprocessRunnerType | containers.ops.AsyncSubprocessRunnerType:
+        if self._use_asyncio:
+            return containers.ops.logging_async_subprocess_runner(logfile, self._console, name)
+        return containers.ops.logging_subprocess_runner(logfile, self._console, name)
+
+    def _command_task(
+        self,
+        step: Step,
+        logfile: pathlib.Path,
+        command: list[str],
+        dependencies: Collection[containers.concurrent.Task[Step]] = (),
+        key: str | None = None,
+    ) -> containers.concurrent.Task[Step]:
+        """Get a task running ``command``.
+
+        :param key: Key of the task in the duration history (default: the step),
+            which must stay the same across source versions.
+        """
+        return containers.concurrent.Task(
+            userdata=step,
+            key=key or str(step),
+            fn=self._runner(logfile, str(step)),
+            args=(command,),
+            dependencies=dependencies,
+        )
+
+    def _slug(self, image: containers.Image) -> str:
+        return SLUG_INVALID_CHARS_REGEX.sub('-', image.id)
 
-    def _docker_client(self, image: containers.Image) -> containers.ops.DockerClient:
-        logfile = self._logdir / f'{image.name}-{image.version}.log'
-        runner = containers.ops.logging_subprocess_runner(logfile)
-        return containers.ops.DockerClient(runner)
+    def _cache_from(self, image: containers.Image) -> list[str]:
+        return [cache.cache_from(self._slug(image)) for cache in self._caches]
+
+    def _cache_to(self, image: containers.Image) -> list[str]:
+        return [cache.cache_to(self._slug(image)) for cache in self._caches]
+
+    def _logfile(self, image: containers.Image) -> pathlib.Path:
+        return self._logdir / f'{image.name}-{image.version}.log'
 
     def _repo_tags(self, image: containers.Image) -> list[str]:
         return list(itertools.chain.from_iterable([
@@ -38,31 +122,200 @@ class Builder:
         for image in self._images:
             image.template.render(self._srcdir / image.id)
 
-    def build(self) -> Iterator[bool, containers.concurrent.Task[containers.Image]]:
-        yield from containers.concurrent.run_tasks([
-            containers.concurrent.Task(
-                userdata=image,
-                fn=self._docker_client(image).build,
-                args=(
-                    self._srcdir / image.id,
-                    image.tags + self._repo_tags(image),
-                    self._env_info,
-                ),
-            )
+    def _decide(self, image: containers.Image, force: bool, base_images: dict[str, str | None]) -> Decision:
+        current = containers.manifest.ImageManifest(
+            context=containers.manifest.context_digest(self._srcdir / image.id),
+            base_images=base_images,
+            labels=self._env_info,
+            tags=image.tags + self._repo_tags(image),
+        )
+        previous = self._manifest.get(image.id) if self._manifest else None
+        if force:
+            return Decision('build', 'forced', current)
+        if previous is None:
+            return Decision('build', 'no previous build', current)
+        if previous.context != current.context:
+            return Decision('build', 'the build context changed', current)
+        if None in current.base_images.values():
+            return Decision('build', 'could not resolve the base image digest', current)
+        if previous.base_images != current.base_images:
+            return Decision('build', 'the base image changed', current)
+        if not self._docker_client.image_exists(image.id):
+            return Decision('build', 'the previous build is not available locally', current)
+
+        # The image is unchanged, so keep the labels of the build that produced it
+        current.labels = previous.labels
+        # Only the current tags are recorded, the ones of older source versions don't need to be added again
+        new_tags = [tag for tag in current.tags if tag not in previous.tags]
+        if new_tags:
+            return Decision('tag', f'unchanged, adding {len(new_tags)} new tags', current, tuple(new_tags))
+        return Decision('skip', 'unchanged', current)
+
+    def plan(self, force: bool = False) -> dict[str, Decision]:
+        """Decide whether each image needs to be built, only tagged, or can be skipped.
+
+        Images are rebuilt when their rendered build context or base image
+        digest changed since the build recorded in the manifest. Without a
+        manifest, or with ``force``, all images are built.
+        """
+        image_base_images = {
+            image.id: containers.manifest.base_images(self._srcdir / image.id / 'Dockerfile')
             for image in self._images
-        ])
-
-    def push(self) -> Iterator[bool, containers.concurrent.Task[tuple[containers.Image, containers.Repo]]]:
-        yield from containers.concurrent.run_tasks([
-            containers.concurrent.Task(
-                userdata=tag,
-                fn=self._docker_client(image).push,
-                args=(tag,),
-            )
-            for repo in self._repos
+        }
+        names = sorted(set(itertools.chain.from_iterable(image_base_images.values())))
+        if force and self._manifest is None:
+            # There is nothing to compare the digests with, nor to record them in
+            digests = dict.fromkeys(names)
+        else:
+            # Each lookup is a registry round trip, and most images share their base image
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                digests = dict(zip(names, executor.map(self._docker_client.manifest_digest, names)))
+        self._decisions = {
+            image.id: self._decide(image, force, {name: digests[name] for name in image_base_images[image.id]})
             for image in self._images
-            for tag in repo.tags(image.tags)
-        ])
+        }
+        return self._decisions
+
+    def record(self, completed: Collection[containers.concurrent.Task[Step]]) -> None:
+        """Record the images whose build (or tagging) completed in the manifest, and save it."""
+        if self._manifest is None:
+            return
+        completed = set(completed)
+        for image_id, decision in self._decisions.items():
+            if all(task in completed for task in self._image_tasks.get(image_id, [])):
+                self._manifest.record(image_id, decision.manifest)
+        self._manifest.save()
+
+    def _needs_build(self, image: containers.Image) -> bool:
+        decision = self._decisions.get(image.id)
+        return decision is None or decision.action == 'build'
+
+    def bake_definition(self, images: Collection[containers.Image]) -> dict[str, Any]:
+        """Get the ``docker buildx bake`` definition (JSON format) building the given images."""
+        targets = {
+            self._slug(image): {
+                'context': os.fspath(self._srcdir / image.id),
+                'dockerfile': 'Dockerfile',
+                'tags': image.tags + self._repo_tags(image),
+                'labels': self._env_info,
+                'cache-from': self._cache_from(image),
+                'cache-to': self._cache_to(image),
+            }
+            for image in images
+        }
+        return {
+            'group': {'default': {'targets': list(targets)}},
+            'target': targets,
+        }
+
+    def tasks(
+        self,
+        push: bool = False,
+        data_outdir: pathlib.Path | None = None,
+        bake: bool = False,
+    ) -> list[containers.concurrent.Task[Step]]:
+        """Get the tasks of the pipeline.
+
+        The push and data generation of each image depend only on its build, so
+        that they start as soon as the image is built, instead of waiting for
+        all the other images. The task functions are subprocess runners, and
+        are coroutine functions if ``use_asyncio`` was set (see
+        :py:func:`containers.concurrent.run_tasks_async`).
+
+        With ``bake``, all the images are built by a single ``docker buildx
+        bake`` task, so that BuildKit schedules the builds, and shares the
+        common layers between them. The definition is written to the sources
+        directory.
+        """
+        tasks = []
+        generate_tasks = []
+        bake_task = None
+        if bake and (bake_images := [image for image in self._images if self._needs_build(image)]):
+            definition = self._srcdir / 'docker-bake.json'
+            definition.parent.mkdir(exist_ok=True, parents=True)
+            definition.write_text(json.dumps(self.bake_definition(bake_images), indent=2))
+            bake_task = self._command_task(
+                Step('bake', f'{len(bake_images)} images'),
+                self._logdir / 'bake.log',
+                self._docker_client.bake_command(definition),
+            )
+            tasks.append(bake_task)
+        for image in self._images:
+            decision = self._decisions.get(image.id)
+            if bake_task and self._needs_build(image):
+                image_tasks = [bake_task]
+            elif self._needs_build(image):
+                image_tasks = [self._command_task(
+                    Step('build', image.id),
+                    self._logfile(image),
+                    self._docker_client.build_command(
+                        self._srcdir / image.id,
+                        image.tags + self._repo_tags(image),
+                        self._env_info,
+                        cache_from=self._cache_from(image),
+                        cache_to=self._cache_to(image),
+                    ),
+                )]
+            elif decision.action == 'tag':
+                image_tasks = [
+                    self._command_task(
+                        Step('tag', tag),
+                        self._logfile(image),
+                        self._docker_client.tag_command(image.id, tag),
+                        # The tags include the source version
+                        key=f'tag {image.id}',
+                    )
+                    for tag in decision.new_tags
+                    if tag != image.id
+                ]
+            else:
+                image_tasks = []
+            self._image_tasks[image.id] = image_tasks
+            tasks += [task for task in image_tasks if task is not bake_task]
+            if push:
+                tasks += [
+                    self._command_task(
+                        Step('push', tag),
+                        self._logfile(image),
+                        self._docker_client.push_command(tag),
+                        dependencies=image_tasks,
+                        key=f'push {image.id}',
+                    )
+                    for repo in self._repos
+                    for tag in repo.tags(image.tags)
+                    # An unchanged image only needs its new tags pushed
+                    if decision is None or decision.action != 'tag' or tag in decision.new_tags
+                ]
+            if data_outdir and not isinstance(image, containers.RollingImage):
+                generate_tasks.append(self._command_task(
+                    Step('generate', image.id),
+                    self._logfile(image),
+                    [
+                        sys.executable, os.fspath(GENERATE_DATA_SCRIPT_PATH),
+                        '--outdir', os.fspath(data_outdir),
+                        '--images', image.id,
+                        '--jobs', '1',
+                        '--no-bundle',
+                        # the runs of the other images write to the same directory concurrently
+                        '--no-checkpoint',
+                    ],
+                    dependencies=image_tasks,
+                ))
+        if generate_tasks:
+            # Bundles the data once all images have been introspected, which are all up to date by then
+            ids = [task.userdata.target for task in generate_tasks]
+            generate_tasks.append(self._command_task(
+                Step('bundle', os.fspath(data_outdir)),
+                self._logdir / 'generate-data.log',
+                [
+                    sys.executable, os.fspath(GENERATE_DATA_SCRIPT_PATH),
+                    '--outdir', os.fspath(data_outdir),
+                    '--images', *ids,
+                    '--incremental',
+                ],
+                dependencies=list(generate_tasks),
+            ))
+        return tasks + generate_tasks
 
 
 def main() -> None:
@@ -78,6 +331,56 @@ def main() -> None:
     )
     images_group.add_argument('--rolling', action='store_true')
     parser.add_argument('--push', action='store_true')
+    parser.add_argument(
+        '--generate-data',
+        metavar='OUTDIR',
+        type=pathlib.Path,
+        help=(
+            'also generate the data of each (non-rolling) image, as soon as it is built '
+            '(not used by the meson build, which generates the data in a separate target)'
+        ),
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        help='maximum number of tasks to run concurrently',
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        type=pathlib.Path,
+        help='write the span of each task to FILE, in the Chrome trace event format',
+    )
+    parser.add_argument(
+        '--bake',
+        action='store_true',
+        help='build all images with a single buildx bake invocation',
+    )
+    parser.add_argument(
+        '--cache-dir',
+        type=pathlib.Path,
+        help='import and export the build cache from/to a local directory (needs eg. the docker-container driver)',
+    )
+    parser.add_argument(
+        '--cache-registry',
+        metavar='REF',
+        help='import and export the build cache from/to a registry image, tagged per image (eg. localhost:5000/cache)',
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='build all images, even the ones whose sources and base image did not change since the last build',
+    )
+    parser.add_argument(
+        '--live',
+        action='store_true',
+        help='show the output of the running tasks, each line prefixed with its task',
+    )
+    parser.add_argument(
+        '--asyncio',
+        action='store_true',
+        help='run the tasks as asyncio subprocesses, which are terminated on the first failure',
+    )
     images_group.add_argument(
         '--build-path',
         type=pathlib.Path,
@@ -92,27 +395,89 @@ def main() -> None:
 
     srcdir = args.build_path / 'src'
     logdir = args.build_path / 'logs'
-    builder = Builder(target_images, config.repos, srcdir, logdir)
+    caches = []
+    if args.cache_dir:
+        caches.append(containers.ops.BuildCache('local', os.fspath(args.cache_dir.absolute())))
+    if args.cache_registry:
+        caches.append(containers.ops.BuildCache('registry', args.cache_registry))
+
+    manifest = containers.manifest.BuildManifest(args.build_path / 'manifest.json')
+    builder = Builder(
+        target_images,
+        config.repos,
+        srcdir,
+        logdir,
+        use_asyncio=args.asyncio,
+        manifest=manifest,
+        caches=caches,
+        console=containers.ops.Console() if args.live else None,
+    )
 
     print('Generating sources...')
     builder.generate_sources()
 
-    print('Building images...')
-    for successful, task in builder.build():
-        image = task.userdata
+    print('Checking for changes...')
+    for image_id, decision in builder.plan(force=args.force).items():
+        print(f'- {decision.action} {image_id}: {decision.reason}')
+
+    print('Running the build pipeline...')
+    tasks = builder.tasks(push=args.push, data_outdir=args.generate_data, bake=args.bake)
+    history = containers.concurrent.DurationHistory(args.build_path / 'durations.json')
+    predicted = None
+    if history:
+        predicted = containers.concurrent.predict_makespan(tasks, history.expected_duration, args.jobs)
+        print(f'Predicted makespan: {predicted:.2f}s')
+    messages = {
+        'build': ('built', 'failed to build'),
+        'tag': ('tagged', 'failed to tag'),
+        'bake': ('baked', 'failed to bake'),
+        'push': ('pushed', 'failed to push'),
+        'generate': ('generated data for', 'failed to generate data for'),
+        'bundle': ('bundled data in', 'failed to bundle data in'),
+    }
+    completed = []
+
+    def report(successful: bool, task: containers.concurrent.Task[Step]) -> None:
+        step = task.userdata
+        success_message, failure_message = messages[step.action]
+        print(f'- {success_message if successful else failure_message} {step.target}')
         if successful:
-            print(f'- built {image.id}')
+            completed.append(task)
+
+    async def run_async() -> None:
+        async for successful, task in containers.concurrent.run_tasks_async(
+            tasks,
+            max_workers=args.jobs,
+            expected_duration=history.expected_duration,
+        ):
+            report(successful, task)
+
+    start = time.perf_counter()
+    try:
+        if args.asyncio:
+            asyncio.run(run_async())
         else:
-            print(f'- failed to build {image.id}')
-
-    if args.push:
-        print('Pushing images...')
-        for successful, task in builder.push():
-            tag = task.userdata
-            if successful:
-                print(f'- pushed {tag}')
-            else:
-                print(f'- failed to push {tag}')
+            for successful, task in containers.concurrent.run_tasks(
+                tasks,
+                max_workers=args.jobs,
+                expected_duration=history.expected_duration,
+            ):
+                report(successful, task)
+    finally:
+        builder.record(completed)
+        history.record(completed)
+        makespan = time.perf_counter() - start
+        if predicted is None:
+            print(f'Makespan: {makespan:.2f}s')
+        else:
+            print(f'Makespan: {makespan:.2f}s (predicted {predicted:.2f}s)')
+        print(containers.concurrent.trace_summary(tasks, args.jobs))
+        if args.trace:
+            containers.concurrent.write_trace(args.trace, tasks)
+        path, duration = containers.concurrent.critical_path(tasks)
+        print(f'Critical path ({duration:.2f}s):')
+        for task in path:
+            print(f'- {task.userdata}: {task.duration or 0.0:.2f}s')
 
 
 if __name__ == '__main__':
@@ -1,8 +1,15 @@
+import asyncio
 import concurrent.futures
 import dataclasses
+import heapq
+import json
+import os
+import pathlib
+import statistics
 import sys
+import time
 
-from collections.abc import Collection
+from collections.abc import AsyncIterator, Collection
 from typing import Any, Callable, Generic, Iterator, TypeVar
 
 
@@ -13,30 +20,421 @@ if sys.version_info < (3, 11):
 _T = TypeVar('_T')
 
 
-@dataclasses.dataclass
+# Tasks are compared by identity, so that they can be used as dependencies
+@dataclasses.dataclass(eq=False)
 class Task(Generic[_T]):
     userdata: _T
     fn: Callable[..., None]
     args: Collection[Any] = ()
     kwargs: dict[str, Any] = dataclasses.field(default_factory=dict)
+    #: Tasks that must complete successfully before this one is started.
+    dependencies: Collection['Task[Any]'] = ()
+    #: Identifies the task across runs, to keep track of its duration (see :py:class:`DurationHistory`).
+    key: str | None = None
+    #: When the task was ready to run, started and finished (:py:func:`time.perf_counter`), set by the runner.
+    queued: float | None = dataclasses.field(default=None, init=False)
+    started: float | None = dataclasses.field(default=None, init=False)
+    finished: float | None = dataclasses.field(default=None, init=False)
+    #: Worker slot the task ran in, from 0 to ``max_workers - 1``, set by the runner.
+    worker: int | None = dataclasses.field(default=None, init=False)
 
+    @property
+    def duration(self) -> float | None:
+        """Time spent running the task, in seconds, once it has completed."""
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
 
-def run_tasks(tasks: Task[_T], fast_fail: bool = True) -> Iterator[tuple[bool, Task[_T]]]:
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_to_task_map = {
-            executor.submit(task.fn, *task.args, *task.kwargs): task
-            for task in tasks
-        }
-
-        for future in concurrent.futures.as_completed(future_to_task_map):
-            if future.exception():
-                if fast_fail:
-                    executor.shutdown(cancel_futures=True)
-                yield False, future_to_task_map[future]
-                if fast_fail:
-                    break
-            elif not future.cancelled():
-                yield True, future_to_task_map[future]
+    def _run(self) -> None:
+        self.started = time.perf_counter()
+        try:
+            self.fn(*self.args, **self.kwargs)
+        finally:
+            self.finished = time.perf_counter()
+
+    async def _run_async(self) -> None:
+        self.started = time.perf_counter()
+        try:
+            await self.fn(*self.args, **self.kwargs)
+        finally:
+            self.finished = time.perf_counter()
+
+
+def auto_jobs(memory_per_job: int | None = None) -> int:
+    """Number of tasks to run concurrently, based on the host CPUs and memory.
+
+    :param memory_per_job: Expected memory usage of each task, in bytes.
+    """
+    jobs = os.cpu_count() or 1
+    if memory_per_job:
+        try:
+            memory = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (AttributeError, ValueError, OSError):  # not available on this platform
+            pass
+        else:
+            jobs = min(jobs, memory // memory_per_job)
+    return max(jobs, 1)
+
+
+def _dependents(tasks: Collection[Task[_T]]) -> dict[Task[_T], list[Task[_T]]]:
+    dependents: dict[Task[_T], list[Task[_T]]] = {task: [] for task in tasks}
+    for task in tasks:
+        for dependency in task.dependencies:
+            if dependency not in dependents:
+                raise ValueError(f'dependency of {task.userdata} is not in the task list: {dependency.userdata}')
+            dependents[dependency].append(task)
+    return dependents
+
+
+def _topological_order(tasks: Collection[Task[_T]]) -> list[Task[_T]]:
+    dependents = _dependents(tasks)
+    remaining = {task: len(task.dependencies) for task in tasks}
+    order = [task for task, count in remaining.items() if count == 0]
+    for task in order:  # order grows as we go
+        for dependent in dependents[task]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                order.append(dependent)
+    if len(order) != len(remaining):
+        raise ValueError('the task dependencies have a cycle')
+    return order
+
+
+def critical_path(tasks: Collection[Task[_T]]) -> tuple[list[Task[_T]], float]:
+    """Find the chain of dependent tasks with the longest total duration.
+
+    This is the lower bound of the time needed to run the tasks, regardless
+    of the number of workers. Tasks that didn't run count as zero.
+
+    :returns: The tasks of the chain, in order, and its total duration, in seconds.
+    """
+    finish: dict[Task[_T], float] = {}
+    previous: dict[Task[_T], Task[_T] | None] = {}
+    for task in _topological_order(tasks):
+        previous[task] = max(task.dependencies, key=finish.__getitem__, default=None)
+        start = finish[previous[task]] if previous[task] else 0.0
+        finish[task] = start + (task.duration or 0.0)
+
+    last = max(finish, key=finish.__getitem__, default=None)
+    if last is None:
+        return [], 0.0
+    path = []
+    task = last
+    while task is not None:
+        path.append(task)
+        task = previous[task]
+    return path[::-1], finish[last]
+
+
+def write_trace(
+    path: pathlib.Path,
+    tasks: Collection[Task[_T]],
+    name: Callable[[Task[_T]], str] = lambda task: str(task.userdata),
+) -> None:
+    """Write the spans of the tasks that ran, in the Chrome trace event format.
+
+    The file can be opened in ``chrome://tracing`` or https://ui.perfetto.dev,
+    with a row per worker slot.
+
+    :param name: Name of the span of a task.
+    """
+    ran = [task for task in tasks if task.duration is not None]
+    origin = min((task.queued or task.started for task in ran), default=0.0)
+
+    def microseconds(seconds: float) -> float:
+        return round(seconds * 1e6, 3)
+
+    events: list[dict[str, Any]] = [
+        {'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': worker, 'args': {'name': f'worker {worker}'}}
+        for worker in sorted({task.worker for task in ran})
+    ]
+    for task in ran:
+        queued = task.queued if task.queued is not None else task.started
+        events.append({
+            'name': name(task),
+            'cat': 'task',
+            'ph': 'X',
+            'pid': 0,
+            'tid': task.worker,
+            'ts': microseconds(task.started - origin),
+            'dur': microseconds(task.duration),
+            'args': {
+                'queued_us': microseconds(queued - origin),
+                'wait_us': microseconds(task.started - queued),
+                'dependencies': [name(dependency) for dependency in task.dependencies],
+            },
+        })
+    path.parent.mkdir(exist_ok=True, parents=True)
+    path.write_text(json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}))
+
+
+def trace_summary(tasks: Collection[Task[_T]], max_workers: int | None = None) -> str:
+    """Summarize how the workers were used by the tasks that ran.
+
+    :param max_workers: Number of worker slots (default: the slots used by the tasks).
+    """
+    ran = [task for task in tasks if task.duration is not None]
+    if not ran:
+        return 'No task ran'
+    workers = max_workers or max(task.worker for task in ran) + 1
+    wall = max(task.finished for task in ran) - min(task.started for task in ran)
+    busy = sum(task.duration for task in ran)
+    idle = wall * workers - busy
+    waits = [task.started - task.queued for task in ran if task.queued is not None]
+    per_worker: dict[int, float] = {}
+    for task in ran:
+        per_worker[task.worker] = per_worker.get(task.worker, 0.0) + task.duration
+    lines = [
+        f'Wall time: {wall:.2f}s, busy: {busy:.2f}s over {len(ran)} tasks',
+        f'Workers: {len(per_worker)} of {workers} used, '
+        f'utilization: {busy / (wall * workers) if wall else 1.0:.0%}, idle: {idle:.2f}s',
+    ]
+    if waits:
+        lines.append(f'Queue wait: mean {statistics.fmean(waits):.2f}s, max {max(waits):.2f}s')
+    lines += [
+        f'- worker {worker}: busy {busy_time:.2f}s, idle {wall - busy_time:.2f}s'
+        for worker, busy_time in sorted(per_worker.items())
+    ]
+    return '\n'.join(lines)
+
+
+def _default_workers() -> int:
+    # Same as concurrent.futures.ThreadPoolExecutor
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _no_expected_duration(task: Task[Any]) -> float:
+    return 0.0
+
+
+class DurationHistory:
+    """Durations of the tasks of the previous runs, by key, persisted in a JSON file."""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self._path = path
+        self._durations: dict[str, float] = {}
+        if path.is_file():
+            self._durations = json.loads(path.read_text())
+
+    def __bool__(self) -> bool:
+        return bool(self._durations)
+
+    def expected_duration(self, task: Task[Any]) -> float:
+        """Duration of the last run of the task, or the mean of all known durations if the task is new."""
+        if task.key in self._durations:
+            return self._durations[task.key]
+        return statistics.fmean(self._durations.values()) if self._durations else 0.0
+
+    def record(self, tasks: Collection[Task[Any]]) -> None:
+        """Record the duration of tasks that completed, and save the history."""
+        for task in tasks:
+            if task.key is not None and task.duration is not None:
+                self._durations[task.key] = task.duration
+        self._path.parent.mkdir(exist_ok=True, parents=True)
+        self._path.write_text(json.dumps(self._durations, indent=2, sort_keys=True))
+
+
+class _Schedule(Generic[_T]):
+    """Tasks ready to run, longest expected chain of dependents first.
+
+    The priority of a task is its expected duration, plus the longest expected
+    duration of the chains of tasks that depend on it, so long chains are
+    started early, instead of a long task being left to run alone at the end.
+    Ties are broken by the order of the task list.
+    """
+
+    def __init__(
+        self,
+        tasks: Collection[Task[_T]],
+        expected_duration: Callable[[Task[_T]], float],
+        record: bool = True,
+    ) -> None:
+        self._record = record
+        self._dependents = _dependents(tasks)
+        self._remaining = {task: len(task.dependencies) for task in tasks}
+        self._index = {task: index for index, task in enumerate(tasks)}
+        self._priority: dict[Task[_T], float] = {}
+        for task in reversed(_topological_order(tasks)):
+            self._priority[task] = expected_duration(task) + max(
+                (self._priority[dependent] for dependent in self._dependents[task]),
+                default=0.0,
+            )
+        self._ready: list[tuple[float, int, Task[_T]]] = []
+        for task, count in self._remaining.items():
+            if count == 0:
+                self._push(task)
+
+    def __bool__(self) -> bool:
+        return bool(self._ready)
+
+    def _push(self, task: Task[_T]) -> None:
+        if self._record:
+            task.queued = time.perf_counter()
+        heapq.heappush(self._ready, (-self._priority[task], self._index[task], task))
+
+    def pop(self) -> Task[_T]:
+        _, _, task = heapq.heappop(self._ready)
+        return task
+
+    def complete(self, task: Task[_T]) -> None:
+        for dependent in self._dependents[task]:
+            # Dependents of a failed task have already been skipped
+            if dependent in self._remaining:
+                self._remaining[dependent] -= 1
+                if self._remaining[dependent] == 0:
+                    self._push(dependent)
+
+    def skip(self, task: Task[_T]) -> list[Task[_T]]:
+        """Drop everything downstream of a failed task."""
+        skipped = []
+        pending = list(self._dependents[task])
+        for dependent in pending:  # pending grows as we go
+            if self._remaining.pop(dependent, None) is not None:
+                skipped.append(dependent)
+                pending += self._dependents[dependent]
+        return skipped
+
+
+def predict_makespan(
+    tasks: Collection[Task[_T]],
+    expected_duration: Callable[[Task[_T]], float],
+    max_workers: int | None = None,
+) -> float:
+    """Simulate :py:func:`run_tasks` with the expected duration of the tasks.
+
+    :returns: The expected time to run all the tasks, in seconds.
+    """
+    schedule = _Schedule(tasks, expected_duration, record=False)
+    max_workers = max_workers or _default_workers()
+    index = {task: index for index, task in enumerate(tasks)}
+    running: list[tuple[float, int, Task[_T]]] = []
+    now = 0.0
+    while schedule or running:
+        while schedule and len(running) < max_workers:
+            task = schedule.pop()
+            heapq.heappush(running, (now + expected_duration(task), index[task], task))
+        now, _, task = heapq.heappop(running)
+        schedule.complete(task)
+    return now
+
+
+def run_tasks(
+    tasks: Collection[Task[_T]],
+    fast_fail: bool = True,
+    max_workers: int | None = None,
+    expected_duration: Callable[[Task[_T]], float] = _no_expected_duration,
+) -> Iterator[tuple[bool, Task[_T]]]:
+    """Run tasks concurrently, each as soon as all its dependencies have completed.
+
+    When there are more ready tasks than workers, the tasks with the longest
+    expected chain of dependents are started first (see ``expected_duration``),
+    then the tasks that come first in the list.
+
+    If a task fails, the tasks depending on it (directly or not) are not run,
+    and are reported as failed.
+
+    :param tasks: Tasks to run. Their dependencies must be in the collection.
+    :param fast_fail: Stop at the first failure, cancelling the pending tasks.
+    :param max_workers: Maximum number of tasks to run concurrently.
+    :param expected_duration: Expected duration of a task, in seconds (eg.
+        :py:meth:`DurationHistory.expected_duration`).
+    :returns: The result of each task (successful or not), as they complete.
+    """
+    schedule = _Schedule(tasks, expected_duration)
+    max_workers = max_workers or _default_workers()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        future_to_task_map: dict[concurrent.futures.Future[None], Task[_T]] = {}
+        running: set[concurrent.futures.Future[None]] = set()
+        free_workers = list(range(max_workers))
+        failed = False
+
+        while schedule or running:
+            # Only submit what can run now, so the pending tasks stay ordered by the schedule
+            while schedule and len(running) < max_workers:
+                task = schedule.pop()
+                task.worker = heapq.heappop(free_workers)
+                future = executor.submit(task._run)
+                future_to_task_map[future] = task
+                running.add(future)
+
+            done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                task = future_to_task_map[future]
+                heapq.heappush(free_workers, task.worker)
+                if future.exception():
+                    failed = True
+                    yield False, task
+                    if fast_fail:
+                        break
+                    for dependent in schedule.skip(task):
+                        yield False, dependent
+                else:
+                    yield True, task
+                    schedule.complete(task)
+            if failed and fast_fail:
+                break
+
+    exceptions = [
+        future.exception()
+        for future in future_to_task_map
+        if future.done() and not future.cancelled() and future.exception()
+    ]
+    if exceptions:
+        raise ExceptionGroup('failed to run tasks', exceptions)
+
+
+async def run_tasks_async(
+    tasks: Collection[Task[_T]],
+    fast_fail: bool = True,
+    max_workers: int | None = None,
+    expected_duration: Callable[[Task[_T]], float] = _no_expected_duration,
+) -> AsyncIterator[tuple[bool, Task[_T]]]:
+    """Same as :py:func:`run_tasks`, for tasks whose ``fn`` is a coroutine function.
+
+    The tasks run in the current event loop, so there is no thread per task.
+    Unlike with :py:func:`run_tasks`, the running tasks are cancelled on the
+    first failure (with ``fast_fail``), or when the iteration is stopped (eg.
+    on :py:exc:`KeyboardInterrupt`), which stops their subprocesses when run
+    with :py:func:`containers.ops.logging_async_subprocess_runner`.
+    """
+    schedule = _Schedule(tasks, expected_duration)
+    max_workers = max_workers or _default_workers()
+
+    future_to_task_map: dict[asyncio.Future[None], Task[_T]] = {}
+    running: set[asyncio.Future[None]] = set()
+    free_workers = list(range(max_workers))
+    failed = False
+    try:
+        while schedule or running:
+            while schedule and len(running) < max_workers:
+                task = schedule.pop()
+                task.worker = heapq.heappop(free_workers)
+                future = asyncio.ensure_future(task._run_async())
+                future_to_task_map[future] = task
+                running.add(future)
+
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                task = future_to_task_map[future]
+                heapq.heappush(free_workers, task.worker)
+                if future.exception():
+                    failed = True
+                    yield False, task
+                    if fast_fail:
+                        break
+                    for dependent in schedule.skip(task):
+                        yield False, dependent
+                else:
+                    yield True, task
+                    schedule.complete(task)
+            if failed and fast_fail:
+                break
+    finally:
+        for future in running:
+            future.cancel()
+        if running:
+            await asyncio.wait(running)
 
     exceptions = [
         future.exception()
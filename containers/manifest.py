@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import pathlib
+import re
+
+
+FROM_REGEX = re.compile(r'^FROM\s+(?:--\S+\s+)*(?P<image>\S+)(?:\s+AS\s+(?P<stage>\S+))?', re.IGNORECASE | re.MULTILINE)
+
+
+def context_digest(path: pathlib.Path) -> str:
+    """Digest of the content of a build context directory (file paths and contents)."""
+    hash = hashlib.sha256()
+    for file in sorted(path.rglob('*')):
+        if file.is_file():
+            hash.update(file.relative_to(path).as_posix().encode() + b'\0')
+            hash.update(hashlib.sha256(file.read_bytes()).digest())
+    return 'sha256:' + hash.hexdigest()
+
+
+def base_images(dockerfile: pathlib.Path) -> list[str]:
+    """Get the external images a Dockerfile is based on (ignoring build stages and ``scratch``)."""
+    images = []
+    stages = {'scratch'}
+    for match in FROM_REGEX.finditer(dockerfile.read_text()):
+        if match['image'] not in stages and match['image'] not in images:
+            images.append(match['image'])
+        if match['stage']:
+            stages.add(match['stage'])
+    return images
+
+
+@dataclasses.dataclass
+class ImageManifest:
+    """Inputs of an image build."""
+
+    #: Digest of the rendered build context (see :py:func:`context_digest`).
+    context: str
+    #: Digest of the manifest of each base image, or :py:obj:`None` if it couldn't be resolved.
+    base_images: dict[str, str | None]
+    labels: dict[str, str]
+    tags: list[str]
+
+
+class BuildManifest:
+    """The inputs of the last build of each image, by image id, persisted in a JSON file."""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self._path = path
+        self._images: dict[str, ImageManifest] = {}
+        if path.is_file():
+            self._images = {
+                image_id: ImageManifest(**manifest)
+                for image_id, manifest in json.loads(path.read_text()).items()
+            }
+
+    def get(self, image_id: str) -> ImageManifest | None:
+        return self._images.get(image_id)
+
+    def record(self, image_id: str, manifest: ImageManifest) -> None:
+        self._images[image_id] = manifest
+
+    def save(self) -> None:
+        self._path.parent.mkdir(exist_ok=True, parents=True)
+        data = {
+            image_id: dataclasses.asdict(manifest)
+            for image_id, manifest in sorted(self._images.items())
+        }
+        self._path.write_text(json.dumps(data, indent=2))
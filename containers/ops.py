@@ -1,40 +1,226 @@
+import asyncio
+import collections
+import dataclasses
+import hashlib
 import os
 import pathlib
 import shutil
+import signal
 import subprocess
+import sys
+import threading
 
-from collections.abc import Callable, Collection, Mapping
+from collections.abc import AsyncIterator, Awaitable, Callable, Collection, Mapping
+from typing import Any, BinaryIO, Literal
+
+
+if sys.version_info >= (3, 11):
+    from typing import Self
+else:
+    from typing_extensions import Self
 
 
 SubprocessRunnerType = Callable[[str, ...], bytes]
+AsyncSubprocessRunnerType = Callable[[str, ...], Awaitable[bytes]]
 
+# Longer output lines (eg. BuildKit progress lines) are read in chunks of this size, which bounds the kept tail
+MAX_LINE_LENGTH = 1024 * 1024
 
-def logging_subprocess_runner(logfile: pathlib.Path) -> SubprocessRunnerType:
-    logfile.parent.mkdir(exist_ok=True, parents=True)
 
-    def _log(cmd: list[str], output: bytes) -> None:
-        if not logfile:
-            return
-        with logfile.open('ab') as f:
-            cmd_str = ' '.join(cmd)
-            f.write(f'$ {cmd_str}\n'.encode())
-            f.write(output)
-            if not output.endswith(b'\n'):
-                f.write(b'\n')
+class Console:
+    """Live view of the output of concurrent commands, each line prefixed with the name of its task."""
+
+    def __init__(self, stream: BinaryIO | None = None) -> None:
+        self._stream = stream or sys.stdout.buffer
+        self._lock = threading.Lock()
+
+    def write(self, name: str, line: bytes) -> None:
+        if not line.endswith(b'\n'):
+            line += b'\n'
+        with self._lock:
+            self._stream.write(f'[{name}] '.encode() + line)
+            self._stream.flush()
+
+
+class _OutputLog:
+    """Writes the output of a command to the log file as it is produced, keeping only its tail in memory."""
+
+    def __init__(
+        self,
+        logfile: pathlib.Path,
+        cmd: list[str],
+        tail_lines: int,
+        console: Console | None,
+        name: str,
+    ) -> None:
+        self._file = logfile.open('ab')
+        self._tail: collections.deque[bytes] = collections.deque(maxlen=tail_lines)
+        self._console = console
+        self._name = name
+        self._newline = True
+        cmd_str = ' '.join(cmd)
+        self._file.write(f'$ {cmd_str}\n'.encode())
+        self._file.flush()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if not self._newline:
+            self._file.write(b'\n')
+        self._file.close()
+
+    def write(self, line: bytes) -> None:
+        self._file.write(line)
+        self._file.flush()
+        self._newline = line.endswith(b'\n')
+        self._tail.append(line)
+        if self._console:
+            self._console.write(self._name, line)
+
+    @property
+    def tail(self) -> bytes:
+        return b''.join(self._tail)
+
+
+def logging_subprocess_runner(
+    logfile: pathlib.Path,
+    console: Console | None = None,
+    name: str | None = None,
+    tail_lines: int = 100,
+) -> SubprocessRunnerType:
+    """Get a runner that streams the output (stdout and stderr) of the commands to a log file.
+
+    Only the last ``tail_lines`` lines of the output are kept in memory, and
+    returned by the runner, or set as the output of the
+    :py:exc:`subprocess.CalledProcessError` if the command fails.
+
+    :param console: Also write the output to a live console view, prefixed with ``name``.
+    :param name: Name of the task in the console (default: the log file name, without suffix).
+    """
+    logfile.parent.mkdir(exist_ok=True, parents=True)
+    name = name or logfile.stem
 
     def run(cmd: str) -> bytes:
+        with (
+            _OutputLog(logfile, cmd, tail_lines, console, name) as log,
+            subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT) as process,
+        ):
+            while line := process.stdout.readline(MAX_LINE_LENGTH):
+                log.write(line)
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, cmd, log.tail)
+        return log.tail
+
+    return run
+
+
+async def _terminate_process_group(process: asyncio.subprocess.Process, timeout: float) -> None:
+    # The process leads its own session, so this also stops its children (eg. the buildx plugin)
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+async def _read_lines(stream: asyncio.StreamReader) -> AsyncIterator[bytes]:
+    # StreamReader.readline() discards the lines over the stream limit, read them in chunks instead
+    while True:
         try:
-            output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
-        except subprocess.CalledProcessError as e:
-            output = e.output
-            raise
-        finally:
-            _log(cmd, output)
-        return output
+            line = await stream.readuntil(b'\n')
+        except asyncio.IncompleteReadError as e:
+            line = e.partial
+        except asyncio.LimitOverrunError as e:
+            line = await stream.read(e.consumed)
+        if not line:
+            return
+        yield line
+
+
+def logging_async_subprocess_runner(
+    logfile: pathlib.Path,
+    console: Console | None = None,
+    name: str | None = None,
+    tail_lines: int = 100,
+    terminate_timeout: float = 10.0,
+) -> AsyncSubprocessRunnerType:
+    """Same as :py:func:`logging_subprocess_runner`, with asyncio subprocesses.
+
+    If the runner is cancelled, the process group of the command is
+    terminated, and killed if it is still running after ``terminate_timeout``.
+    """
+    logfile.parent.mkdir(exist_ok=True, parents=True)
+    name = name or logfile.stem
+
+    async def run(cmd: str) -> bytes:
+        with _OutputLog(logfile, cmd, tail_lines, console, name) as log:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                start_new_session=True,
+                limit=MAX_LINE_LENGTH,
+            )
+
+            async def copy_output() -> None:
+                async for line in _read_lines(process.stdout):
+                    log.write(line)
+
+            try:
+                await copy_output()
+                await process.wait()
+            except asyncio.CancelledError:
+                await _terminate_process_group(process, terminate_timeout)
+                # Read the output up to the end, so that the pipe is closed (unless a process left the group)
+                try:
+                    await asyncio.wait_for(copy_output(), terminate_timeout)
+                except asyncio.TimeoutError:
+                    pass
+                log.write(b'(cancelled)\n')
+                raise
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, cmd, log.tail)
+        return log.tail
 
     return run
 
 
+@dataclasses.dataclass
+class BuildCache:
+    """BuildKit cache backend, that builds import from and export to.
+
+    Each image gets its own cache (``scope``), in a subdirectory of the
+    ``local`` cache directory, or a tag of the ``registry`` image reference.
+
+    Exporting the cache isn't supported by the default ``docker`` buildx
+    driver, it needs a builder using eg. the ``docker-container`` driver
+    (``docker buildx create --use --driver docker-container``).
+    """
+
+    type: Literal['local', 'registry']
+    #: Cache directory (local), or image reference without tag (registry).
+    location: str
+
+    def cache_from(self, scope: str) -> str:
+        if self.type == 'local':
+            return f'type=local,src={os.path.join(self.location, scope)}'
+        return f'type=registry,ref={self.location}:{scope}'
+
+    def cache_to(self, scope: str) -> str:
+        # mode=max also exports the layers of the intermediate steps (eg. the package installs)
+        if self.type == 'local':
+            return f'type=local,dest={os.path.join(self.location, scope)},mode=max'
+        return f'type=registry,ref={self.location}:{scope},mode=max'
+
+
 class DockerClient:
     def __init__(self, runner: SubprocessRunnerType = subprocess.check_output) -> None:
         self._runner = runner
@@ -44,17 +230,60 @@ class DockerClient:
             or shutil.which('podman')
         )
 
-    def _run(self, *args: str) -> str:
-        return self._runner([self._client, *args])
+    def _command(self, *args: str) -> list[str]:
+        return [self._client, *args]
 
-    def build(self, path: pathlib.Path, tags: Collection[str], labels: Mapping[str, str]) -> None:
-        self._run(
+    def build_command(
+        self,
+        path: pathlib.Path,
+        tags: Collection[str],
+        labels: Mapping[str, str],
+        cache_from: Collection[str] = (),
+        cache_to: Collection[str] = (),
+    ) -> list[str]:
+        return self._command(
             'buildx',
             'build',
             os.fspath(path),
             *[f'--tag={tag}' for tag in tags],
             *[f'--label={name}={value}' for name, value in labels.items()],
+            *[f'--cache-from={cache}' for cache in cache_from],
+            *[f'--cache-to={cache}' for cache in cache_to],
         )
 
+    def bake_command(self, definition: pathlib.Path, targets: Collection[str] = ()) -> list[str]:
+        return self._command('buildx', 'bake', '--file', os.fspath(definition), *targets)
+
+    def push_command(self, name: str) -> list[str]:
+        return self._command('push', name)
+
+    def tag_command(self, source: str, target: str) -> list[str]:
+        return self._command('tag', source, target)
+
+    def image_exists(self, name: str) -> bool:
+        try:
+            self._runner(self._command('image', 'inspect', name))
+        except subprocess.CalledProcessError:
+            return False
+        return True
+
+    def manifest_digest(self, name: str) -> str | None:
+        """Digest of the registry manifest of an image, or :py:obj:`None` if it can't be fetched."""
+        try:
+            manifest = self._runner(self._command('buildx', 'imagetools', 'inspect', '--raw', name))
+        except subprocess.CalledProcessError:
+            return None
+        return 'sha256:' + hashlib.sha256(manifest).hexdigest()
+
+    def build(
+        self,
+        path: pathlib.Path,
+        tags: Collection[str],
+        labels: Mapping[str, str],
+        cache_from: Collection[str] = (),
+        cache_to: Collection[str] = (),
+    ) -> None:
+        self._runner(self.build_command(path, tags, labels, cache_from, cache_to))
+
     def push(self, name: str) -> None:
-        self._run('push', name)
+        self._runner(self.push_command(name))
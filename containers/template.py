@@ -4,8 +4,6 @@ import shutil
 
 from typing import Any
 
-import jinja2
-
 import containers
 
 
@@ -30,6 +28,9 @@ class Template:
         return containers.TEMPLATES_PATH / self.name
 
     def _render_template_file(self, file: pathlib.Path, outdir: pathlib.Path) -> Any:
+        # Imported lazily, so that the tooling that doesn't render templates works without jinja2
+        import jinja2
+
         template = jinja2.Template(
             file.read_text(),
             trim_blocks=True,
@@ -1,10 +1,24 @@
+from __future__ import annotations
+
+import abc
 import argparse
+import contextlib
+import dataclasses
+import hashlib
 import json
 import os
 import pathlib
+import shutil
+import subprocess
 import sys
+import tempfile
+import time
+
+from typing import TYPE_CHECKING, BinaryIO, Iterator
+
 
-import docker
+if TYPE_CHECKING:
+    import docker
 
 
 sys.path.insert(0, os.fspath(pathlib.Path(__file__).parent.parent))
@@ -14,32 +28,268 @@ import containers
 import containers.concurrent
 
 
+sys.path.insert(0, os.fspath(containers.PYTHON_PATH))
+
+
+import python_environments._bundle
+
+
+GENERATE_SCRIPT_PATH = containers.PYTHON_PATH / 'python_environments' / 'generate.py'
+
+
+def generator_id(all_interpreters: bool = False) -> str:
+    """Identifier of the generation inputs, other than the image itself."""
+    hash = hashlib.sha256(GENERATE_SCRIPT_PATH.read_bytes())
+    if all_interpreters:
+        hash.update(b'--all-interpreters')
+    return 'sha256:' + hash.hexdigest()
+
+
+# Rough memory usage of an introspection container, used to pick the default --jobs
+CONTAINER_MEMORY = 512 * 1024 * 1024
+
+
+@dataclasses.dataclass
+class ContainerTimings:
+    start: float = 0.0
+    run: float = 0.0
+    teardown: float = 0.0
+
+
+class Backend(abc.ABC):
+    """Where the introspection runs."""
+
+    @abc.abstractmethod
+    def primary_interpreter(self, target: str) -> str:
+        """Path of the interpreter the target data is gathered from."""
+
+    @abc.abstractmethod
+    def manifest(self, target: str) -> str | None:
+        """Identifier of the current state of the target, or :py:obj:`None` if it is not available."""
+
+    @abc.abstractmethod
+    def run(self, target: str, args: list[str], stdout: BinaryIO, timings: ContainerTimings) -> None:
+        """Run ``python -m python_environments.generate`` on the target, streaming its stdout to a file."""
+
+
+class DockerBackend(Backend):
+    """Runs the introspection in a container for each image."""
+
+    def __init__(self, docker_client: docker.DockerClient) -> None:
+        import docker.types
+
+        self._client = docker_client
+        self._source_mount = docker.types.Mount(
+            target='/source',
+            source=os.fspath(containers.ROOT),
+            type='bind',
+            read_only=True,
+        )
+
+    def primary_interpreter(self, target: str) -> str:
+        return '/usr/bin/python3'
+
+    def manifest(self, target: str) -> str | None:
+        import docker.errors
+
+        try:
+            return self._client.images.get(target).id
+        except docker.errors.ImageNotFound:
+            return None
+
+    def run(self, target: str, args: list[str], stdout: BinaryIO, timings: ContainerTimings) -> None:
+        """Run a container, streaming its stdout to a file, and recording the time spent in each phase."""
+        import docker.errors
+
+        command = [self.primary_interpreter(target), '-m', 'python_environments.generate', *args]
+        start = time.perf_counter()
+        container = self._client.containers.create(
+            image=target,
+            command=command,
+            environment={'PYTHONPATH': '/source/python'},
+            mounts=[self._source_mount],
+        )
+        try:
+            container.start()
+            timings.start = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for chunk in container.logs(stdout=True, stderr=False, stream=True, follow=True):
+                stdout.write(chunk)
+            exit_status = container.wait()['StatusCode']
+            if exit_status != 0:
+                stderr = container.logs(stdout=False, stderr=True)
+                raise docker.errors.ContainerError(container, exit_status, command, target, stderr)
+            timings.run = time.perf_counter() - start
+        finally:
+            start = time.perf_counter()
+            container.remove(force=True)
+            timings.teardown = time.perf_counter() - start
+
+
+class LocalBackend(Backend):
+    """Runs the introspection directly on local interpreters (eg. virtual environments), by name."""
+
+    def __init__(self, interpreters: dict[str, str]) -> None:
+        self._interpreters = interpreters
+
+    def primary_interpreter(self, target: str) -> str:
+        # Matches sys.executable, which resolves bare names (eg. python3) through PATH
+        executable = self._interpreters[target]
+        return os.path.abspath(shutil.which(executable) or executable)
+
+    def manifest(self, target: str) -> str | None:
+        path = os.path.realpath(self._interpreters[target])
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        state = f'{path}:{stat.st_size}:{stat.st_mtime_ns}'
+        return 'sha256:' + hashlib.sha256(state.encode()).hexdigest()
+
+    def run(self, target: str, args: list[str], stdout: BinaryIO, timings: ContainerTimings) -> None:
+        env = os.environ | {'PYTHONPATH': os.fspath(containers.PYTHON_PATH)}
+        start = time.perf_counter()
+        subprocess.run(
+            [self._interpreters[target], '-m', 'python_environments.generate', *args],
+            stdout=stdout,
+            env=env,
+            check=True,
+        )
+        timings.run = time.perf_counter() - start
+
+
+def is_up_to_date(backend: Backend, target: str, out: pathlib.Path, generator: str) -> bool:
+    try:
+        with out.open() as f:
+            metadata = json.load(f)['metadata']
+    except (OSError, ValueError, KeyError, TypeError):
+        # Missing, or unreadable (eg. truncated by an interrupted run), so it needs to be generated again
+        return False
+    manifest = backend.manifest(target)
+    return manifest is not None and metadata.get('manifest') == manifest and metadata.get('generator') == generator
+
+
+# Read once, os.umask() can only be read by setting it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
 
-SOURCE_MOUNT = docker.types.Mount(
-    target='/source',
-    source=os.fspath(containers.ROOT),
-    type='bind',
-    read_only=True,
-)
+@contextlib.contextmanager
+def atomic_write(path: pathlib.Path) -> Iterator[BinaryIO]:
+    """Write to a temporary file, which is moved to ``path`` only if successful."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # mkstemp creates the file as 0600, use the mode open() would have used instead
+            os.fchmod(f.fileno(), 0o666 & ~UMASK)
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
 
 
-def generate_image_data(tag: str, out: pathlib.Path) -> None:
+def generate_image_data(
+    backend: Backend,
+    target: str,
+    out: pathlib.Path,
+    all_interpreters: bool = False,
+    timings: ContainerTimings | None = None,
+) -> None:
     out.parent.mkdir(exist_ok=True, parents=True)
-    docker_client = docker.from_env()
-    raw_introspection_data = docker_client.containers.run(
-        image=tag,
-        command=['/usr/bin/python3', '-m', 'python_environments.generate'],
-        environment={'PYTHONPATH': '/source/python'},
-        mounts=[SOURCE_MOUNT],
-    )
-    data = {
-        'metadata': {
-            'manifest': docker_client.images.get(tag).id,
-        },
-        'data': json.loads(raw_introspection_data.decode()),
+    args = ['--all-interpreters'] if all_interpreters else []
+
+    with tempfile.TemporaryFile(dir=out.parent) as raw:
+        backend.run(target, args, raw, timings or ContainerTimings())
+
+        # This validates the output, we need the parsed data for the digest anyway
+        raw.seek(0)
+        introspection_data = json.load(raw)
+        interpreters_data = None
+        if all_interpreters:
+            # The primary interpreter data is kept in 'data', to keep the format compatible
+            interpreters_data = introspection_data
+            introspection_data = interpreters_data.pop(backend.primary_interpreter(target))
+        metadata = {
+            'manifest': backend.manifest(target),
+            'digest': python_environments._bundle.digest(introspection_data, interpreters_data),
+            'generator': generator_id(all_interpreters),
+        }
+
+        with atomic_write(out) as f:
+            if all_interpreters:
+                data = {
+                    'metadata': metadata,
+                    'data': introspection_data,
+                    'interpreters': interpreters_data,
+                }
+                f.write(json.dumps(data, sort_keys=True, indent=4).encode())
+            else:
+                # Copy the (already formatted) container output as-is, instead of re-encoding it
+                raw.seek(0)
+                f.write(b'{\n"data": ')
+                shutil.copyfileobj(raw, f)
+                f.write(b',\n"metadata": ')
+                f.write(json.dumps(metadata, sort_keys=True, indent=4).encode())
+                f.write(b'\n}\n')
+
+
+class Checkpoint:
+    """Record of the images generated by the current run, so that an interrupted run can be resumed."""
+
+    # Not a .json file, so that it is never mistaken for image data
+    FILENAME = '.generate-data-checkpoint'
+
+    def __init__(self, outdir: pathlib.Path, generator: str, enabled: bool = True) -> None:
+        self._path = outdir / self.FILENAME
+        self._generator = generator
+        # Disabled when other runs share the output directory, as they would overwrite each other's checkpoint
+        self._enabled = enabled
+        self.completed: set[str] = set()
+        if enabled and self._path.is_file():
+            state = json.loads(self._path.read_text())
+            if state['generator'] == generator:
+                self.completed = set(state['completed'])
+
+    def _save(self) -> None:
+        state = {'generator': self._generator, 'completed': sorted(self.completed)}
+        with atomic_write(self._path) as f:
+            f.write(json.dumps(state).encode())
+
+    def add(self, image_id: str) -> None:
+        self.completed.add(image_id)
+        if self._enabled:
+            self._save()
+
+    def clear(self) -> None:
+        self.completed.clear()
+        if self._enabled:
+            self._path.unlink(missing_ok=True)
+
+
+def print_timings(timings: dict[str, ContainerTimings]) -> None:
+    print('Container timings (start / run / teardown):')
+    for image_id, timing in sorted(timings.items(), key=lambda item: item[1].run, reverse=True):
+        print(f'- {image_id}: {timing.start:.2f}s / {timing.run:.2f}s / {timing.teardown:.2f}s')
+
+
+def write_bundle(outdir: pathlib.Path) -> None:
+    # All the images of the directory, not only the ones of this run, as the bundle replaces the per-image files
+    documents = {
+        file.name.removesuffix('.json'): json.loads(file.read_text())
+        for file in sorted(outdir.glob('*.json'))
+        # Skip hidden files (eg. temporary files)
+        if not file.name.startswith('.')
     }
-    with out.open('w') as f:
-        json.dump(data, fp=f, sort_keys=True, indent=4)
+    python_environments._bundle.write(outdir / python_environments._bundle.FILENAME, documents)
+
+
+def parse_interpreter(value: str) -> tuple[str, str]:
+    name, sep, path = value.rpartition('=')
+    if not sep:
+        name = os.path.basename(path)
+    return name, path
 
 
 def main() -> None:
@@ -48,31 +298,147 @@ def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--outdir', type=pathlib.Path, default=containers.PYTHON_PATH / '.data')
     parser.add_argument('--list-files', action='store_true')
+    parser.add_argument(
+        '--backend',
+        choices=['docker', 'local'],
+        default='docker',
+        help='run the introspection in the container images (docker), or on local interpreters (local)',
+    )
+    parser.add_argument(
+        '--interpreter',
+        metavar='[NAME=]PATH',
+        type=parse_interpreter,
+        action='append',
+        default=[],
+        help='interpreter to introspect with the local backend (default: the current interpreter, as "local")',
+    )
+    parser.add_argument(
+        '--images',
+        nargs='+',
+        choices=config.images.ids,
+        help='images to introspect with the docker backend (default: all non-rolling images)',
+    )
+    parser.add_argument(
+        '--no-bundle',
+        dest='bundle',
+        action='store_false',
+        help="don't write the data bundle (eg. when the images are introspected by separate runs)",
+    )
+    parser.add_argument(
+        '--all-interpreters',
+        action='store_true',
+        help='also introspect the other Python interpreters of each image (in the same container)',
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='skip the images whose manifest and generator did not change since the existing data was generated',
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=containers.concurrent.auto_jobs(CONTAINER_MEMORY),
+        help='number of containers to run concurrently (default: based on the host CPUs and memory)',
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='skip the images already generated by the previous (interrupted or failed) run',
+    )
+    parser.add_argument(
+        '--no-checkpoint',
+        dest='checkpoint',
+        action='store_false',
+        help="don't record the progress of the run (eg. when other runs write to the same output directory)",
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        type=pathlib.Path,
+        help='write the span of each task to FILE, in the Chrome trace event format',
+    )
     args = parser.parse_args()
+    if args.resume and not args.checkpoint:
+        parser.error('--resume needs the checkpoint, it cannot be used with --no-checkpoint')
 
-    # TODO: Figure out how rolling images should be supported.
-    target_images = config.images.filter(ignore=containers.RollingImage)
+    if args.backend == 'local':
+        interpreters = dict(args.interpreter or [('local', sys.executable)])
+        targets = list(interpreters)
+    elif args.images:
+        targets = args.images
+    else:
+        # TODO: Figure out how rolling images should be supported.
+        targets = config.images.filter(ignore=containers.RollingImage).ids
 
     if args.list_files:
-        print(' '.join([f'{image.id}.json' for image in target_images]))
+        print(' '.join([f'{target}.json' for target in targets] + [python_environments._bundle.FILENAME]))
         return
 
+    if args.backend == 'local':
+        backend = LocalBackend(interpreters)
+    else:
+        import docker
+
+        # Shared by all tasks, with a connection per concurrent task
+        backend = DockerBackend(docker.from_env(max_pool_size=args.jobs))
+
+    stale_targets = list(targets)
+    if args.incremental:
+        print('Checking existing image data...')
+        generator = generator_id(args.all_interpreters)
+        stale_targets = []
+        for target in targets:
+            if is_up_to_date(backend, target, args.outdir / f'{target}.json', generator):
+                print(f'- up to date: {target}')
+            else:
+                print(f'- outdated: {target}')
+                stale_targets.append(target)
+        print(f'{len(targets) - len(stale_targets)} up to date, {len(stale_targets)} to generate')
+
+    args.outdir.mkdir(exist_ok=True, parents=True)
+    checkpoint = Checkpoint(args.outdir, generator_id(args.all_interpreters), enabled=args.checkpoint)
+    if args.resume:
+        stale_targets = [
+            target for target in stale_targets
+            if target not in checkpoint.completed or not (args.outdir / f'{target}.json').is_file()
+        ]
+        print(f'Resuming, {len(checkpoint.completed)} images were already generated')
+    else:
+        checkpoint.clear()
+
+    timings = {target: ContainerTimings() for target in stale_targets}
     tasks = [
         containers.concurrent.Task(
-            userdata=image,
+            userdata=target,
             fn=generate_image_data,
-            args=(image.id, args.outdir / f'{image.id}.json'),
+            args=(backend, target, args.outdir / f'{target}.json'),
+            kwargs={
+                'all_interpreters': args.all_interpreters,
+                'timings': timings[target],
+            },
         )
-        for image in target_images
+        for target in stale_targets
     ]
 
-    print('Generating image data...')
-    for successful, task in containers.concurrent.run_tasks(tasks):
-        image = task.userdata
-        if successful:
-            print(f'- generated data for {image.id}')
-        else:
-            print(f'- failed to generate data for {image.id}')
+    print(f'Generating image data ({args.jobs} jobs)...')
+    try:
+        for successful, task in containers.concurrent.run_tasks(tasks, max_workers=args.jobs):
+            target = task.userdata
+            if successful:
+                checkpoint.add(target)
+                print(f'- generated data for {target}')
+            else:
+                print(f'- failed to generate data for {target}')
+    finally:
+        print_timings(timings)
+        print(containers.concurrent.trace_summary(tasks, args.jobs))
+        if args.trace:
+            containers.concurrent.write_trace(args.trace, tasks)
+    checkpoint.clear()
+
+    if args.bundle:
+        print('Writing data bundle...')
+        write_bundle(args.outdir)
 
 
 if __name__ == '__main__':
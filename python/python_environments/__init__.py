@@ -5,6 +5,26 @@ import sys
 
 # We do this so that the python -m python_environments.generate works on older versions.
 if sys.version_info >= (3, 9):  # project.requires-python
-    from python_environments._init import get, ImageData
+    from python_environments._init import (
+        get,
+        get_all,
+        cache_info,
+        clear_cache,
+        configure_cache,
+        intern_info,
+        preload,
+        CacheInfo,
+        ImageData,
+    )
 
-    __all__ = ['get', 'ImageData']
+    __all__ = [
+        'get',
+        'get_all',
+        'cache_info',
+        'clear_cache',
+        'configure_cache',
+        'intern_info',
+        'preload',
+        'CacheInfo',
+        'ImageData',
+    ]
@@ -0,0 +1,163 @@
+"""Packed single-file bundle of the image data.
+
+Layout
+------
+
+.. code-block:: text
+
+    +-------+---------------+--------+-------------------------+
+    | magic | header length | header | values                  |
+    +-------+---------------+--------+-------------------------+
+      8 B     8 B (LE u64)    JSON     compact JSON, per key
+
+The header maps each image to its metadata and to the ``(offset, length)`` of
+each of its values, relative to the start of the values section. Values are
+encoded individually, so that a single key can be decoded without touching the
+rest of the image data. The data of the other interpreters of the image, when
+present, is indexed the same way, by executable path.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import pathlib
+import struct
+
+from typing import Any, Optional, Union
+from collections.abc import Iterator, Mapping
+
+
+FILENAME = 'images.bundle'
+
+_MAGIC = b'PYENVB01'
+_HEADER_LENGTH = struct.Struct('<Q')
+_VALUES_START = len(_MAGIC) + _HEADER_LENGTH.size
+
+
+def _encode(value: Any) -> bytes:
+    # default=dict, so that other mapping types (eg. interned values) are supported
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), default=dict).encode()
+
+
+def digest(data: Mapping[str, Any], interpreters: Optional[Mapping[str, Mapping[str, Any]]] = None) -> str:
+    """Content digest of image data, over its canonical encoding.
+
+    :param data: Data of the primary interpreter.
+    :param interpreters: Data of the other interpreters, by executable path, if any.
+    """
+    # Without other interpreters, this is the digest of the data alone, which keeps the existing digests valid
+    content = {'data': data, 'interpreters': interpreters} if interpreters else data
+    return 'sha256:' + hashlib.sha256(_encode(content)).hexdigest()
+
+
+def write(path: pathlib.Path, images: Mapping[str, Mapping[str, Any]]) -> None:
+    """Write a bundle file.
+
+    :param path: Destination file.
+    :param images: Image data documents (``metadata``, ``data``, and optionally
+        ``interpreters``), by image name.
+    """
+    index = {}
+    values = bytearray()
+
+    def add_values(data: Mapping[str, Any]) -> dict[str, tuple[int, int]]:
+        keys = {}
+        for key, value in sorted(data.items()):
+            encoded = _encode(value)
+            keys[key] = (len(values), len(encoded))
+            values.extend(encoded)
+        return keys
+
+    for name, document in sorted(images.items()):
+        index[name] = {
+            'metadata': document['metadata'],
+            'keys': add_values(document['data']),
+        }
+        if interpreters := document.get('interpreters'):
+            index[name]['interpreters'] = {
+                executable: add_values(data)
+                for executable, data in sorted(interpreters.items())
+            }
+
+    header = _encode(index)
+    with path.open('wb') as f:
+        f.write(_MAGIC)
+        f.write(_HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(values)
+
+
+class LazyImageData(Mapping):
+    """Image data mapping that decodes each value on first access."""
+
+    def __init__(self, bundle: 'Bundle', keys: Mapping[str, tuple[int, int]]) -> None:
+        self._bundle = bundle
+        self._keys = keys
+        self._values: dict[str, Any] = {}
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        offset, length = self._keys[key]
+        value = self._values[key] = self._bundle._decode(offset, length)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+
+class Bundle:
+    """Reader for bundle files."""
+
+    def __init__(self, buffer: Union[bytes, mmap.mmap]) -> None:
+        if buffer[:len(_MAGIC)] != _MAGIC:
+            raise ValueError('not an image data bundle')
+        (header_length,) = _HEADER_LENGTH.unpack_from(buffer, len(_MAGIC))
+        self._buffer = buffer
+        self._index = json.loads(buffer[_VALUES_START:_VALUES_START + header_length])
+        self._values_start = _VALUES_START + header_length
+
+    @classmethod
+    def open(cls, file: Any) -> 'Bundle':
+        """Open a bundle file, memory-mapping it when it is in the filesystem.
+
+        :param file: File path or :py:class:`importlib.resources.abc.Traversable`.
+        """
+        if not isinstance(file, (str, os.PathLike)):
+            return cls(file.read_bytes())
+        with open(file, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _decode(self, offset: int, length: int) -> Any:
+        start = self._values_start + offset
+        return json.loads(self._buffer[start:start + length])
+
+    @property
+    def images(self) -> list[str]:
+        return list(self._index)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._index
+
+    def metadata(self, name: str) -> Mapping[str, Any]:
+        return self._index[name]['metadata']
+
+    def size(self, name: str) -> int:
+        """Size of the encoded values of an image, in bytes."""
+        return sum(length for _, length in self._index[name]['keys'].values())
+
+    def data(self, name: str) -> LazyImageData:
+        return LazyImageData(self, self._index[name]['keys'])
+
+    def interpreters(self, name: str) -> dict[str, LazyImageData]:
+        """Data of the other interpreters of an image, by executable path."""
+        return {
+            executable: LazyImageData(self, keys)
+            for executable, keys in self._index[name].get('interpreters', {}).items()
+        }
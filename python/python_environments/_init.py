@@ -1,15 +1,25 @@
 """Collection of description files for common Python environments."""
 
+import concurrent.futures
+import functools
+import gc
+import hashlib
 import json
 import os
 import pathlib
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+import types
 import warnings
 
-from typing import Any
-from collections.abc import Iterator, Mapping
+from typing import Any, NamedTuple, Optional, TypeVar
+from collections.abc import Callable, Iterator, Mapping
+
+from python_environments import _bundle, _intern
 
 
 if sys.version_info >= (3, 11):
@@ -18,21 +28,88 @@ else:
     from importlib.abc import Traversable
 
 
-def _generate_data() -> Traversable:
-    """This helper generates the data when running the module from source."""
-    srcdir = pathlib.Path(__file__).parent.parent
+_T = TypeVar('_T')
+
+
+def _once(fn: Callable[[], _T]) -> Callable[[], _T]:
+    """Like :py:func:`functools.cache`, but concurrent first calls wait for a single evaluation."""
+    lock = threading.Lock()
+    result: list[_T] = []
+
+    @functools.wraps(fn)
+    def wrapper() -> _T:
+        if not result:
+            with lock:
+                if not result:
+                    result.append(fn())
+        return result[0]
+
+    return wrapper
+
+
+def _user_cache_dir() -> pathlib.Path:
+    if path := os.environ.get('PYTHON_ENVIRONMENTS_CACHE_DIR'):
+        return pathlib.Path(path)
+    if sys.platform == 'win32':
+        base = pathlib.Path(os.environ.get('LOCALAPPDATA') or pathlib.Path.home() / 'AppData' / 'Local')
+    elif sys.platform == 'darwin':
+        base = pathlib.Path.home() / 'Library' / 'Caches'
+    else:
+        base = pathlib.Path(os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home() / '.cache')
+    return base / 'python-environments'
+
+
+def _source_data_key(srcdir: pathlib.Path) -> str:
+    """Hash of the source files the generated data depends on."""
+    rootdir = srcdir.parent
+    inputs = [
+        rootdir / 'environments.toml',
+        srcdir / 'generate-data.py',
+        srcdir / 'python_environments' / 'generate.py',
+        *sorted(path for path in (rootdir / 'containers' / 'templates').rglob('*') if path.is_file()),
+    ]
+    hash = hashlib.sha256()
+    for path in inputs:
+        hash.update(path.relative_to(rootdir).as_posix().encode() + b'\0')
+        hash.update(path.read_bytes() + b'\0')
+    return hash.hexdigest()
+
+
+def _generate_data(srcdir: Optional[pathlib.Path] = None) -> Traversable:
+    """This helper generates the data when running the module from source.
+
+    The generated data is kept in a per-user cache, keyed on a hash of its
+    inputs, so that it only has to be generated once for each source revision.
+
+    :param srcdir: Source directory of the package (default: the one of this module).
+    """
+    srcdir = srcdir or pathlib.Path(__file__).parent.parent
     generation_script = srcdir / 'generate-data.py'
     datadir = srcdir / '.data'
 
     if not datadir.exists():
+        cachedir = _user_cache_dir() / 'data' / _source_data_key(srcdir)
+        if cachedir.is_dir():
+            shutil.copytree(cachedir, datadir)
+            return datadir
+
         warnings.warn(f'Running from source and no data found in {os.fspath(datadir)}, generating it.')
         datadir.mkdir()
         try:
-            subprocess.check_call([sys.executable, os.fspath(generation_script), os.fspath(datadir)])
+            subprocess.check_call([sys.executable, os.fspath(generation_script), '--outdir', os.fspath(datadir)])
         except Exception:
             shutil.rmtree(datadir)
             raise
 
+        # Copy to a temporary directory first, so that the cache entry is added atomically
+        cachedir.parent.mkdir(parents=True, exist_ok=True)
+        tmpdir = pathlib.Path(tempfile.mkdtemp(dir=cachedir.parent))
+        shutil.copytree(datadir, tmpdir, dirs_exist_ok=True)
+        try:
+            tmpdir.rename(cachedir)
+        except OSError:  # another process added it in the meantime
+            shutil.rmtree(tmpdir)
+
     return datadir
 
 
@@ -47,6 +124,7 @@ def _is_running_from_source() -> bool:
     return False
 
 
+@_once
 def _get_data_dir() -> Traversable:
     if _is_running_from_source():
         return _generate_data()
@@ -62,19 +140,58 @@ def _get_data_dir() -> Traversable:
     return importlib.resources.files('python_environments.data')
 
 
-def _read_data() -> Mapping[str, Mapping[str, Any]]:
-    data_dir = _get_data_dir()
-    return {
-        file.name.removesuffix('.json'): json.loads(file.read_text())
-        for file in data_dir.iterdir()
-        if file.is_file()
-    }
+@_once
+def _get_bundle() -> Optional[_bundle.Bundle]:
+    file = _get_data_dir().joinpath(_bundle.FILENAME)
+    if not file.is_file():
+        return None
+    return _bundle.Bundle.open(file)
+
+
+def _image_names() -> list[str]:
+    if (bundle := _get_bundle()) is not None:
+        return bundle.images
+    return sorted(
+        file.name.removesuffix('.json')
+        for file in _get_data_dir().iterdir()
+        # Skip hidden files (eg. the generate-data.py checkpoint, or temporary files)
+        if file.is_file() and file.name.endswith('.json') and not file.name.startswith('.')
+    )
+
+
+def _read_image_data(name: str) -> tuple[Mapping[str, Any], int]:
+    """Read the data document of an image, and its encoded size."""
+    # Prefer the packed bundle, which only decodes the values that are accessed.
+    if (bundle := _get_bundle()) is not None:
+        if name not in bundle:
+            raise KeyError(name)
+        document = {
+            'metadata': bundle.metadata(name),
+            'data': bundle.data(name),
+            'interpreters': bundle.interpreters(name),
+        }
+        return document, bundle.size(name)
+
+    file = _get_data_dir().joinpath(f'{name}.json')
+    if not file.is_file():
+        raise KeyError(name)
+    text = file.read_text()
+    return json.loads(text), len(text)
 
 
 class ImageData(Mapping):  # XXX: Cannot inherit from Protocol and Mapping
     def __repr__(self) -> str:
         return f'{self.__class__.__name__}(image={self.image!r}, manifest={self.manifest!r})'
 
+    def __eq__(self, other: object) -> bool:
+        # Compare the digests instead of the (large, nested) contents
+        if isinstance(other, ImageData):
+            return self.digest == other.digest
+        return super().__eq__(other)
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
     @property
     def image(self) -> str:
         """Image name, including the version (eg. ``debian:10``)."""
@@ -85,12 +202,35 @@ class ImageData(Mapping):  # XXX: Cannot inherit from Protocol and Mapping
         """Manifest of the container from where this data was gathered."""
         raise NotImplementedError
 
+    @property
+    def digest(self) -> str:
+        """Content digest of the data (eg. ``sha256:...``), suitable for cache keys."""
+        raise NotImplementedError
+
+    @property
+    def interpreters(self) -> Mapping[str, Mapping[str, Any]]:
+        """Data of the other interpreters of the image, by executable path.
+
+        Only available if the data was generated with ``--all-interpreters``, empty otherwise.
+        """
+        raise NotImplementedError
+
 
 class _ImageData(ImageData):
-    def __init__(self, image: str, manifest: str, data: Mapping[str, Any]) -> None:
+    def __init__(
+        self,
+        image: str,
+        metadata: Mapping[str, Any],
+        data: Mapping[str, Any],
+        size: int = 0,
+        interpreters: Optional[Mapping[str, Mapping[str, Any]]] = None,
+    ) -> None:
         self._image = image
-        self._manifest = manifest
+        self._metadata = metadata
         self._data = data
+        self._interpreters = interpreters or {}
+        # encoded size of the data, used to account for the cache budget
+        self._size = size
 
     def __getitem__(self, key: str) -> Any:
         return self._data[key]
@@ -107,19 +247,247 @@ class _ImageData(ImageData):
 
     @property
     def manifest(self) -> str:
-        return self._manifest
+        return self._metadata['manifest']
 
+    @functools.cached_property
+    def digest(self) -> str:
+        # Data generated before digests were introduced does not include it
+        return self._metadata.get('digest') or _bundle.digest(self._data, self._interpreters)
 
-_DATA: dict[str, Mapping[str, Any]] = {}
+    @property
+    def interpreters(self) -> Mapping[str, Mapping[str, Any]]:
+        return self._interpreters
+
+
+class CacheInfo(NamedTuple):
+    """Statistics of the :py:class:`ImageData` cache."""
+
+    hits: int
+    misses: int
+    #: Maximum number of cached images, or :py:obj:`None` if unbounded.
+    maxsize: Optional[int]
+    currsize: int
+    #: Maximum size of the cached images, in bytes of encoded data, or :py:obj:`None` if unbounded.
+    maxbytes: Optional[int]
+    currbytes: int
+
+
+class _ImageCache:
+    """LRU cache of :py:class:`ImageData` objects, bounded by count and encoded size.
+
+    Lookups do not take the lock. The entries are published as an immutable
+    snapshot, which is replaced (under the lock) whenever it changes, and the
+    recency of hits is recorded with a plain dictionary write. Each image is
+    loaded exactly once, concurrent callers wait for the thread loading it.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None, maxbytes: Optional[int] = None) -> None:
+        self._lock = threading.Lock()
+        self._entries: Mapping[str, _ImageData] = types.MappingProxyType({})
+        self._recency: dict[str, int] = {}
+        self._loading: dict[str, concurrent.futures.Future[_ImageData]] = {}
+        self._maxsize = maxsize
+        self._maxbytes = maxbytes
+        # XXX: Hits are counted without the lock, so they are approximate under contention
+        self._hits = 0
+        self._misses = 0
+
+    def _hit(self, name: str, image: _ImageData) -> _ImageData:
+        self._recency[name] = time.monotonic_ns()
+        self._hits += 1
+        return image
+
+    def _publish(self, entries: dict[str, _ImageData]) -> None:
+        def over_budget() -> bool:
+            return bool(entries) and (
+                (self._maxsize is not None and len(entries) > self._maxsize)
+                or (self._maxbytes is not None and sum(image._size for image in entries.values()) > self._maxbytes)
+            )
+
+        while over_budget():
+            del entries[min(entries, key=lambda name: self._recency.get(name, 0))]
+        for name in list(self._recency):
+            if name not in entries:
+                self._recency.pop(name, None)
+        self._entries = types.MappingProxyType(entries)
+
+    def get(self, name: str, load: Callable[[str], _ImageData]) -> _ImageData:
+        if (image := self._entries.get(name)) is not None:
+            return self._hit(name, image)
+
+        with self._lock:
+            if (image := self._entries.get(name)) is not None:
+                return self._hit(name, image)
+            if (future := self._loading.get(name)) is not None:
+                owner = False
+            else:
+                future = self._loading[name] = concurrent.futures.Future()
+                owner = True
+                self._misses += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            image = load(name)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._loading[name]
+                if not future.done():
+                    self._recency[name] = time.monotonic_ns()
+                    self._publish({**self._entries, name: image})
+        future.set_result(image)
+        return image
+
+    def store(self, name: str, image: _ImageData) -> None:
+        with self._lock:
+            self._recency[name] = time.monotonic_ns()
+            self._publish({**self._entries, name: image})
+
+    def clear(self) -> None:
+        with self._lock:
+            self._publish({})
+
+    def configure(self, maxsize: Optional[int], maxbytes: Optional[int]) -> None:
+        with self._lock:
+            self._maxsize = maxsize
+            self._maxbytes = maxbytes
+            self._publish(dict(self._entries))
+
+    def info(self) -> CacheInfo:
+        entries = self._entries
+        return CacheInfo(
+            hits=self._hits,
+            misses=self._misses,
+            maxsize=self._maxsize,
+            currsize=len(entries),
+            maxbytes=self._maxbytes,
+            currbytes=sum(image._size for image in entries.values()),
+        )
+
+
+# Populated on first access, so that we only read and decode the data for the
+# images that are actually used.
+_CACHE = _ImageCache()
+# Populated by preload(), never evicted.
+_PRELOADED: dict[str, _ImageData] = {}
+
+
+def _load(name: str) -> _ImageData:
+    document, size = _read_image_data(name)
+    return _ImageData(name, document['metadata'], document['data'], size, document.get('interpreters'))
 
 
 def get(name: str) -> ImageData:
     """Get the bundled data for the specified image.
 
+    The same object is returned for as long as the image stays in the cache
+    (see :py:func:`configure_cache`). After :py:func:`preload`, the preloaded
+    (interned) images are returned instead, whose lists are tuples and
+    dictionaries read-only mappings.
+
     :param name: Image name, including the version (eg. ``debian:10``).
     """
-    global _DATA
-    if not _DATA:
-        _DATA |= _read_data()
+    if (image := _PRELOADED.get(name)) is not None:
+        return image
+    return _CACHE.get(name, _load)
+
+
+def configure_cache(maxsize: Optional[int] = None, maxbytes: Optional[int] = None) -> None:
+    """Set the limits of the :py:class:`ImageData` cache used by :py:func:`get`.
+
+    The least recently used images are evicted when the cache goes over any of
+    the limits. By default, the cache is unbounded.
+
+    :param maxsize: Maximum number of cached images.
+    :param maxbytes: Maximum size of the cached images, in bytes of encoded data.
+    """
+    _CACHE.configure(maxsize, maxbytes)
+
+
+def clear_cache() -> None:
+    """Evict all images from the :py:class:`ImageData` cache.
+
+    Images loaded by :py:func:`preload` are kept.
+    """
+    _CACHE.clear()
+
+
+def cache_info() -> CacheInfo:
+    """Get statistics of the :py:class:`ImageData` cache."""
+    return _CACHE.info()
+
 
-    return _ImageData(name, _DATA[name]['metadata']['manifest'], _DATA[name]['data'])
+_INTERNER = _intern.Interner()
+# Populated by get_all(intern=True), kept apart from the cache so that get() keeps returning the same objects.
+_INTERNED: dict[str, _ImageData] = {}
+_INTERNER_LOCK = threading.Lock()
+
+
+def _load_interned(name: str) -> _ImageData:
+    image = _load(name)
+    interpreters = {executable: dict(data) for executable, data in image.interpreters.items()}
+    return _ImageData(
+        name,
+        image._metadata,
+        _INTERNER.intern(dict(image)),
+        image._size,
+        _INTERNER.intern(interpreters),
+    )
+
+
+def get_all(*, intern: bool = False) -> dict[str, ImageData]:
+    """Get the bundled data for all images.
+
+    :param intern: Deduplicate equal values across images into shared immutable
+        objects (lists become tuples, and dictionaries read-only mappings). This
+        considerably reduces the memory used to keep the whole catalogue loaded,
+        see :py:func:`intern_info`. The interned images are kept for the lifetime
+        of the process, separately from the :py:func:`get` cache, and the same
+        objects are returned on every call.
+    """
+    if not intern:
+        return {name: get(name) for name in _image_names()}
+
+    with _INTERNER_LOCK:
+        for name in _image_names():
+            if name not in _INTERNED:
+                _INTERNED[name] = _load_interned(name)
+        return dict(_INTERNED)
+
+
+def intern_info() -> _intern.InternInfo:
+    """Get statistics of the values interned by :py:func:`get_all`."""
+    return _INTERNER.info()
+
+
+def preload() -> None:
+    """Load all images ahead of time, to share them across forked processes.
+
+    This is meant to be called in the parent process of a pre-fork server. All
+    images are loaded and interned into immutable objects (see :py:func:`get_all`),
+    pinned so that they are never evicted from the cache, and moved out of the
+    garbage collector generations (see :py:func:`gc.freeze`). This avoids the
+    garbage collector writing to those objects in the workers, which would
+    otherwise copy the memory pages they live in.
+
+    From then on, :py:func:`get` returns the interned images, so the values
+    change type: lists become tuples, and dictionaries read-only mappings.
+
+    The garbage collector is disabled while loading, so that collections do not
+    leave freed holes between the preloaded objects, which later allocations
+    would fill (and so write to the shared pages).
+    """
+    global _PRELOADED
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        # Publish a new snapshot, get() reads it without a lock
+        _PRELOADED = {**_PRELOADED, **get_all(intern=True)}
+        gc.freeze()
+    finally:
+        if enabled:
+            gc.enable()
@@ -0,0 +1,65 @@
+"""Structural sharing of equal values across images."""
+
+import sys
+import types
+
+from typing import Any, NamedTuple
+
+
+class InternInfo(NamedTuple):
+    """Statistics of the interning pool."""
+
+    #: Number of distinct values in the pool.
+    values: int
+    #: Number of values that were replaced by an existing pool entry.
+    hits: int
+    #: Estimated number of bytes that were not kept alive thanks to the replaced values.
+    saved_bytes: int
+
+
+class Interner:
+    """Deduplicates equal values into shared immutable objects.
+
+    Strings are shared as-is, lists are converted to tuples, and dictionaries
+    to :py:class:`types.MappingProxyType`. Children are interned before their
+    containers, so containers can be keyed on the identity of their (already
+    canonical) children.
+    """
+
+    def __init__(self) -> None:
+        self._pool: dict[Any, Any] = {}
+        self._hits = 0
+        self._saved_bytes = 0
+
+    def _key(self, value: Any) -> Any:
+        if isinstance(value, (tuple, types.MappingProxyType)):
+            return id(value)
+        # bool and int (or int and float) compare equal, so keep the type in the key
+        return type(value), value
+
+    def _share(self, key: Any, frozen: Any, original: Any) -> Any:
+        try:
+            shared = self._pool[key]
+        except KeyError:
+            self._pool[key] = frozen
+            return frozen
+        self._hits += 1
+        self._saved_bytes += sys.getsizeof(original)
+        return shared
+
+    def intern(self, value: Any) -> Any:
+        """Return the shared immutable counterpart of a JSON value."""
+        if isinstance(value, str):
+            return self._share(value, value, value)
+        if isinstance(value, (list, tuple)):
+            items = tuple(self.intern(item) for item in value)
+            key = (list, tuple(self._key(item) for item in items))
+            return self._share(key, items, value)
+        if isinstance(value, (dict, types.MappingProxyType)):
+            items = {self.intern(k): self.intern(v) for k, v in value.items()}
+            key = (dict, tuple((id(k), self._key(v)) for k, v in items.items()))
+            return self._share(key, types.MappingProxyType(items), value)
+        return value
+
+    def info(self) -> InternInfo:
+        return InternInfo(values=len(self._pool), hits=self._hits, saved_bytes=self._saved_bytes)
@@ -6,22 +6,48 @@ Usage
 .. code-block:: shell
 
     $ python -m python_environments.generate
+
+To find out what each item costs to look up:
+
+.. code-block:: shell
+
+    $ python -m python_environments.generate --write-to-file data.json --profile data.profile.json
+
+To only look up some items, with a time limit for each:
+
+.. code-block:: shell
+
+    $ python -m python_environments.generate --only 'sys.implementation' --only 'sysconfig.get_paths(*)' --timeout 5
+
+To introspect all the Python interpreters in PATH at once:
+
+.. code-block:: shell
+
+    $ python -m python_environments.generate --all-interpreters
 """
 
 import argparse
 import contextlib
+import fnmatch
+import functools
+import glob
 import importlib
 import importlib.abc
 import json
+import os
+import re
+import subprocess
 import sys
 import sysconfig
+import threading
+import time
 import zipimport
 import warnings
 import types
 
 
 if False:  # TYPE_CHECKING
-    from typing import Any, Iterator, Type  # noqa: F401
+    from typing import Any, Callable, Iterator, Sequence, Type  # noqa: F401
 
 
 _REPORT_DATA = {
@@ -170,37 +196,337 @@ def _lookup_item(module, item):  # type: (object, str) -> Any
     return getattr(module, item)
 
 
-# TODO: Type return dictionary.
-def introspect():  # type: () -> dict[str, dict[str, Any]]
-    """Introspect the current environment.
+_LEGACY_MANYLINUX_MAP = {
+    (2, 17): 'manylinux2014',
+    (2, 12): 'manylinux2010',
+    (2, 5): 'manylinux1',
+}
 
-    :returns: Environment data.
-    """
 
-    data = {}
+def _normalize_tag(value):  # type: (str) -> str
+    return value.replace('.', '_').replace('-', '_').replace(' ', '_')
+
 
+def _glibc_version():  # type: () -> tuple[int, int] | None
+    try:
+        name, version = os.confstr('CS_GNU_LIBC_VERSION').split()
+    except (AttributeError, OSError, ValueError):
+        return None
+    match = re.match(r'(\d+)\.(\d+)', version)
+    if name != 'glibc' or not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def _musl_version():  # type: () -> tuple[int, int] | None
+    for loader in glob.glob('/lib/ld-musl-*.so.1'):
+        process = subprocess.run([loader], stderr=subprocess.PIPE, universal_newlines=True)
+        match = re.search(r'^Version (\d+)\.(\d+)', process.stderr, re.MULTILINE)
+        if match:
+            return int(match.group(1)), int(match.group(2))
+    return None
+
+
+def _platform_tags():  # type: () -> Iterator[str]
+    platform = _normalize_tag(sysconfig.get_platform())
+    if not platform.startswith('linux_'):
+        yield platform
+        return
+    if sys.maxsize <= 2**32:
+        platform = {'linux_x86_64': 'linux_i686', 'linux_aarch64': 'linux_armv8l'}.get(platform, platform)
+    arch = platform[len('linux_'):]
+    archs = {'armv8l': ['armv8l', 'armv7l']}.get(arch, [arch])
+
+    for arch in archs:
+        yield f'linux_{arch}'
+    glibc = _glibc_version()
+    if glibc:
+        too_old_minor = 4 if set(archs) & {'x86_64', 'i686'} else 16
+        for arch in archs:
+            for minor in range(glibc[1], too_old_minor, -1):
+                yield f'manylinux_{glibc[0]}_{minor}_{arch}'
+                if (glibc[0], minor) in _LEGACY_MANYLINUX_MAP:
+                    yield f'{_LEGACY_MANYLINUX_MAP[glibc[0], minor]}_{arch}'
+    musl = _musl_version()
+    if musl:
+        for arch in archs:
+            for minor in range(musl[1], -1, -1):
+                yield f'musllinux_{musl[0]}_{minor}_{arch}'
+
+
+def _cpython_abis(version):  # type: (tuple[int, int]) -> list[str]
+    nodot = f'{version[0]}{version[1]}'
+    debug = 'd' if sysconfig.get_config_var('Py_DEBUG') else ''
+    threading = 't' if version >= (3, 13) and sysconfig.get_config_var('Py_GIL_DISABLED') else ''
+    pymalloc = ''
+    if version < (3, 8) and sysconfig.get_config_var('WITH_PYMALLOC') in (1, None):
+        pymalloc = 'm'
+    abis = [f'cp{nodot}{threading}{debug}{pymalloc}']
+    if debug and version >= (3, 8):
+        # Debug builds can also load "normal" extension modules.
+        abis.append(f'cp{nodot}{threading}')
+    return abis
+
+
+def _generic_abis():  # type: () -> list[str]
+    parts = (sysconfig.get_config_var('EXT_SUFFIX') or '').split('.')
+    soabi = parts[1] if len(parts) >= 3 else ''
+    if soabi.startswith('cpython'):
+        return ['cp' + soabi.split('-')[1]]
+    if soabi.startswith('pypy'):
+        return [_normalize_tag('-'.join(soabi.split('-')[:2]))]
+    if soabi.startswith('graalpy'):
+        return [_normalize_tag('-'.join(soabi.split('-')[:3]))]
+    return [_normalize_tag(soabi)] if soabi else []
+
+
+def sys_tags():  # type: () -> Iterator[str]
+    """Supported wheel tags, in order of preference.
+
+    Mirrors :py:func:`packaging.tags.sys_tags`, which we cannot depend on here.
+    """
+    version = sys.version_info[:2]
+    nodot = sysconfig.get_config_var('py_version_nodot') or f'{version[0]}{version[1]}'
+    name = {'cpython': 'cp', 'pypy': 'pp'}.get(sys.implementation.name, sys.implementation.name)
+    platforms = list(_platform_tags())
+
+    if name == 'cp':
+        interpreter = f'cp{nodot}'
+        abis = _cpython_abis(version)
+        for abi in abis:
+            for platform in platforms:
+                yield f'{interpreter}-{abi}-{platform}'
+        use_abi3 = not any(abi.startswith('cp') and abi.endswith('t') for abi in abis)
+        if use_abi3:
+            for platform in platforms:
+                yield f'{interpreter}-abi3-{platform}'
+        for platform in platforms:
+            yield f'{interpreter}-none-{platform}'
+        if use_abi3:
+            for minor in range(version[1] - 1, 1, -1):
+                for platform in platforms:
+                    yield f'cp{version[0]}{minor}-abi3-{platform}'
+    else:
+        interpreter = f'{name}{nodot}'
+        for abi in _generic_abis() + ['none']:
+            for platform in platforms:
+                yield f'{interpreter}-{abi}-{platform}'
+
+    python_versions = [f'py{version[0]}{version[1]}', f'py{version[0]}'] + [
+        f'py{version[0]}{minor}' for minor in range(version[1] - 1, -1, -1)
+    ]
+    for python_version in python_versions:
+        for platform in platforms:
+            yield f'{python_version}-none-{platform}'
+    compatible_interpreter = {'cp': interpreter, 'pp': 'pp3'}.get(name)
+    if compatible_interpreter:
+        yield f'{compatible_interpreter}-none-any'
+    for python_version in python_versions:
+        yield f'{python_version}-none-any'
+
+
+def _items():  # type: () -> Iterator[tuple[str, Callable[[], Any]]]
+    """Names of the items to introspect, and the functions to look them up."""
     # data from list
     for module_name, items in _REPORT_DATA.items():
         module = importlib.import_module(module_name)
         for item_name in items:
-            item_fullname = f'{module_name}.{item_name}'
-            with _log_exceptions(item_fullname):
-                value = _lookup_item(module, item_name)
-            data[item_fullname] = value
+            yield f'{module_name}.{item_name}', functools.partial(_lookup_item, module, item_name)
 
     # custom data
     for scheme in sysconfig.get_scheme_names():
-        item = f"sysconfig.get_paths('{scheme}')"
-        with _log_exceptions(item):
-            data[item] = sysconfig.get_paths(scheme)
+        yield f"sysconfig.get_paths('{scheme}')", functools.partial(sysconfig.get_paths, scheme)
     for key in ('prefix', 'home', 'user'):
-        item = f"sysconfig.get_preferred_scheme('{key}')"
-        with _log_exceptions(item):
-            data[item] = sysconfig.get_preferred_scheme(key)
+        # sysconfig.get_preferred_scheme is only available on Python >= 3.10, so look it up lazily
+        yield f"sysconfig.get_preferred_scheme('{key}')", lambda key=key: sysconfig.get_preferred_scheme(key)
+    # precomputed wheel compatibility
+    yield 'python_environments.generate.sys_tags()', lambda: list(sys_tags())
 
+
+class _Profiler:
+    """Records the wall time, memory allocations, and spawned subprocesses of each item."""
+
+    def __init__(self):  # type: () -> None
+        self.records = {}  # type: dict[str, dict[str, Any]]
+        try:
+            import tracemalloc
+            tracemalloc.start()
+        except (ImportError, RuntimeError):  # not supported (eg. PyPy)
+            self._tracemalloc = None
+        else:
+            self._tracemalloc = tracemalloc
+
+    @contextlib.contextmanager
+    def _track_subprocesses(self):  # type: () -> Iterator[list[str]]
+        spawned = []  # type: list[str]
+        popen_init = subprocess.Popen.__init__
+
+        @functools.wraps(popen_init)
+        def init(popen, args, *rest, **kwargs):  # type: (subprocess.Popen[Any], Any, Any, Any) -> None
+            spawned.append(args if isinstance(args, str) else ' '.join(map(str, args)))
+            popen_init(popen, args, *rest, **kwargs)
+
+        subprocess.Popen.__init__ = init  # type: ignore[method-assign]
+        try:
+            yield spawned
+        finally:
+            subprocess.Popen.__init__ = popen_init  # type: ignore[method-assign]
+
+    @contextlib.contextmanager
+    def measure(self, item):  # type: (str) -> Iterator[None]
+        if self._tracemalloc:
+            if hasattr(self._tracemalloc, 'reset_peak'):  # Python >= 3.9
+                self._tracemalloc.reset_peak()
+            memory_before, _ = self._tracemalloc.get_traced_memory()
+        with self._track_subprocesses() as spawned:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                wall_time = time.perf_counter() - start
+                record = self.records[item] = {
+                    'wall_time': wall_time,
+                    'subprocesses': spawned,
+                }
+                if self._tracemalloc:
+                    memory_after, memory_peak = self._tracemalloc.get_traced_memory()
+                    record['allocated'] = memory_after - memory_before
+                    record['allocated_peak'] = memory_peak - memory_before
+
+    def summary(self, limit=20):  # type: (int) -> str
+        ranked = sorted(self.records.items(), key=lambda entry: entry[1]['wall_time'], reverse=True)
+        total = sum(record['wall_time'] for record in self.records.values())
+        lines = [f'profile: {len(self.records)} items, {total * 1000:.1f} ms total, slowest first']
+        for item, record in ranked[:limit]:
+            line = f'{record["wall_time"] * 1000:10.2f} ms'
+            if 'allocated_peak' in record:
+                line += f' {record["allocated_peak"] / 1024:10.1f} KiB'
+            if record['subprocesses']:
+                line += f'  [{len(record["subprocesses"])} subprocess(es)]'
+            lines.append(f'{line}  {item}')
+        return '\n'.join(lines)
+
+
+def _is_selected(item, only, exclude):  # type: (str, Sequence[str], Sequence[str]) -> bool
+    if only and not any(fnmatch.fnmatchcase(item, pattern) for pattern in only):
+        return False
+    return not any(fnmatch.fnmatchcase(item, pattern) for pattern in exclude)
+
+
+def _call_with_timeout(function, timeout):  # type: (Callable[[], Any], float) -> Any
+    # The lookup runs on a daemon thread, which is abandoned if it times out
+    result = {}  # type: dict[str, Any]
+
+    def target():  # type: () -> None
+        try:
+            result['value'] = function()
+        except BaseException as e:
+            result['exception'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f'timed out after {timeout}s')
+    if 'exception' in result:
+        raise result['exception']
+    return result['value']
+
+
+# TODO: Type return dictionary.
+def introspect(profiler=None, only=(), exclude=(), timeout=None):
+    # type: (_Profiler | None, Sequence[str], Sequence[str], float | None) -> dict[str, dict[str, Any]]
+    """Introspect the current environment.
+
+    :param profiler: Profiler to record the cost of looking up each item.
+    :param only: Glob patterns of the items to look up (eg. ``sysconfig.get_paths(*)``).
+        By default, all items are looked up.
+    :param exclude: Glob patterns of the items to skip.
+    :param timeout: Maximum time, in seconds, to wait for the lookup of each item.
+        Items that time out are reported with a :py:class:`LookupWarning`, and left out.
+    :returns: Environment data.
+    """
+
+    data = {}
+    for item, lookup in _items():
+        if not _is_selected(item, only, exclude):
+            continue
+        measure = profiler.measure(item) if profiler else contextlib.ExitStack()  # no-op
+        with _log_exceptions(item), measure:
+            data[item] = lookup() if timeout is None else _call_with_timeout(lookup, timeout)
     return data
 
 
+_INTERPRETER_NAME_REGEX = re.compile(r'^(python|pypy)(\d+(\.\d+)?)?$')
+
+
+def _find_interpreters():  # type: () -> list[str]
+    """Find the Python interpreters in PATH, other than the current one."""
+    seen = {os.path.realpath(sys.executable)}
+    interpreters = []
+    for directory in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        # prefer the shortest name for interpreters available under multiple names
+        for name in sorted(filter(_INTERPRETER_NAME_REGEX.match, names), key=lambda name: (len(name), name)):
+            path = os.path.join(directory, name)
+            if not os.access(path, os.X_OK) or os.path.realpath(path) in seen:
+                continue
+            seen.add(os.path.realpath(path))
+            interpreters.append(path)
+    return interpreters
+
+
+def introspect_all(only=(), exclude=(), timeout=None):
+    # type: (Sequence[str], Sequence[str], float | None) -> dict[str, dict[str, Any]]
+    """Introspect all the Python interpreters in PATH.
+
+    The other interpreters run ``python -m python_environments.generate`` in
+    parallel, while the current one is introspected in-process.
+
+    :param only: See :py:func:`introspect`.
+    :param exclude: See :py:func:`introspect`.
+    :param timeout: See :py:func:`introspect`.
+    :returns: Environment data of each interpreter, by executable path.
+    """
+    args = []
+    for pattern in only:
+        args += ['--only', pattern]
+    for pattern in exclude:
+        args += ['--exclude', pattern]
+    if timeout is not None:
+        args += ['--timeout', str(timeout)]
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env.get('PYTHONPATH'),
+    ]))
+    processes = {
+        path: subprocess.Popen(
+            [path, '-m', 'python_environments.generate', *args],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+        )
+        for path in _find_interpreters()
+    }
+
+    # round-trip through JSON, so that our data has the same types as the others
+    results = {
+        sys.executable: json.loads(_Encoder().encode(introspect(only=only, exclude=exclude, timeout=timeout))),
+    }
+    for path, process in processes.items():
+        stdout, stderr = process.communicate()
+        if process.returncode != 0:
+            warnings.warn(f'failed to introspect {path}: {stderr.decode(errors="replace").strip()}')
+            continue
+        results[path] = json.loads(stdout)
+    return results
+
+
 class _Encoder(json.JSONEncoder):
     def _is_subclass_or_instance(self, o, cls):  # type: (object, Type[Any]) -> bool
         with contextlib.suppress(TypeError):
@@ -232,12 +558,55 @@ class _Encoder(json.JSONEncoder):
             return repr(o)
 
 
-def _main():  # type: () -> None
+def _parser():  # type: () -> argparse.ArgumentParser
     parser = argparse.ArgumentParser()
     parser.add_argument('--write-to-file', required=False)
+    parser.add_argument(
+        '--profile',
+        metavar='FILE',
+        required=False,
+        help='record the cost of looking up each item to FILE, and print a summary to stderr',
+    )
+    parser.add_argument(
+        '--only',
+        metavar='PATTERN',
+        action='append',
+        default=[],
+        help='only look up the items matching this glob pattern (can be passed multiple times)',
+    )
+    parser.add_argument(
+        '--exclude',
+        metavar='PATTERN',
+        action='append',
+        default=[],
+        help='skip the items matching this glob pattern (can be passed multiple times)',
+    )
+    parser.add_argument(
+        '--timeout',
+        metavar='SECONDS',
+        type=float,
+        required=False,
+        help='maximum time to wait for the lookup of each item',
+    )
+    parser.add_argument(
+        '--all-interpreters',
+        action='store_true',
+        help='introspect all Python interpreters in PATH, outputting the data of each by executable path',
+    )
+    return parser
+
+
+def _main():  # type: () -> None
+    parser = _parser()
     args = parser.parse_args()
 
-    data = introspect()
+    profiler = _Profiler() if args.profile else None
+    if args.all_interpreters:
+        if profiler:
+            parser.error('--profile is not supported with --all-interpreters')
+        data = introspect_all(only=args.only, exclude=args.exclude, timeout=args.timeout)
+    else:
+        data = introspect(profiler, only=args.only, exclude=args.exclude, timeout=args.timeout)
     json_data = _Encoder(sort_keys=True, indent=4).encode(data)
 
     if args.write_to_file:
@@ -246,6 +615,11 @@ def _main():  # type: () -> None
     else:
         print(json_data)
 
+    if profiler:
+        with open(args.profile, 'w') as f:
+            json.dump(profiler.records, f, sort_keys=True, indent=4)
+        print(profiler.summary(), file=sys.stderr)
+
 
 if __name__ == '__main__':
     _main()
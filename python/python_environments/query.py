@@ -0,0 +1,96 @@
+"""Queries across all the bundled images.
+
+Indexes are built lazily, one per key, on the first query for that key, and
+kept for the life of the process. Only the queried key is decoded for each
+image. Results are :py:class:`frozenset` objects of image names, so that
+queries can be combined with the set operators.
+
+Example Usage
+-------------
+
+.. code-block:: python
+
+    import python_environments.query as query
+
+
+    aarch64 = query.where('sysconfig.get_platform()', 'linux-aarch64')
+    py312 = query.between('sys.hexversion', 0x030c0000)
+    aarch64 & py312
+"""
+
+import bisect
+import functools
+import numbers
+
+from typing import Any, Optional
+from collections.abc import Mapping
+
+from python_environments import _init
+
+
+__all__ = ['images', 'where', 'between']
+
+
+def _hashable(value: Any) -> Any:
+    # Tagged with the type, as eg. 1, 1.0 and True are equal (and hash the same), and so are a list and a mapping's items
+    if isinstance(value, (list, tuple)):
+        return list, tuple(_hashable(item) for item in value)
+    if isinstance(value, Mapping):
+        return dict, tuple((key, _hashable(item)) for key, item in sorted(value.items()))
+    return type(value), value
+
+
+def _values(key: str) -> dict[str, Any]:
+    values = {}
+    for name in _init._image_names():
+        data = _init.get(name)
+        if key in data:
+            values[name] = data[key]
+    return values
+
+
+@functools.cache
+def _value_index(key: str) -> dict[Any, frozenset[str]]:
+    index: dict[Any, set[str]] = {}
+    for name, value in _values(key).items():
+        index.setdefault(_hashable(value), set()).add(name)
+    return {value: frozenset(names) for value, names in index.items()}
+
+
+@functools.cache
+def _range_index(key: str) -> tuple[list[Any], list[str]]:
+    entries = sorted(
+        (value, name)
+        for name, value in _values(key).items()
+        if isinstance(value, numbers.Real) and not isinstance(value, bool)
+    )
+    return [value for value, _ in entries], [name for _, name in entries]
+
+
+@functools.cache
+def images() -> frozenset[str]:
+    """Get the names of all bundled images."""
+    return frozenset(_init._image_names())
+
+
+def where(key: str, value: Any) -> frozenset[str]:
+    """Find the images where ``key`` is equal to ``value``.
+
+    :param key: Data key (eg. ``sysconfig.get_platform()``).
+    :param value: Value to match, of the same type (eg. ``1`` does not match
+        ``True`` or ``1.0``). Lists and tuples are equivalent.
+    """
+    return _value_index(key).get(_hashable(value), frozenset())
+
+
+def between(key: str, start: Optional[float] = None, stop: Optional[float] = None) -> frozenset[str]:
+    """Find the images where the numeric ``key`` is in the ``[start, stop)`` range.
+
+    :param key: Data key (eg. ``sys.hexversion``).
+    :param start: Lower bound (inclusive), or :py:obj:`None` for no bound.
+    :param stop: Upper bound (exclusive), or :py:obj:`None` for no bound.
+    """
+    values, names = _range_index(key)
+    lo = 0 if start is None else bisect.bisect_left(values, start)
+    hi = len(values) if stop is None else bisect.bisect_left(values, stop)
+    return frozenset(names[lo:hi])
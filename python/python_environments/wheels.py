@@ -0,0 +1,92 @@
+"""Wheel compatibility across all the bundled images.
+
+The supported tags of each image are precomputed when generating the data
+(see :py:func:`python_environments.generate.sys_tags`),
+and indexed by tag on first use, so that matching a wheel is a handful of
+dictionary lookups, regardless of the number of images.
+
+Example Usage
+-------------
+
+.. code-block:: python
+
+    import python_environments.wheels
+
+
+    python_environments.wheels.match([
+        'numpy-2.0.0-cp312-cp312-manylinux_2_17_x86_64.manylinux2014_x86_64.whl',
+        'six-1.16.0-py2.py3-none-any.whl',
+    ])
+"""
+
+import functools
+
+from collections.abc import Iterable
+
+from python_environments import _init
+
+
+__all__ = ['TAGS_KEY', 'wheel_tags', 'match']
+
+
+#: Data key holding the supported tags of the image, in order of preference.
+TAGS_KEY = 'python_environments.generate.sys_tags()'
+
+
+def wheel_tags(filename: str) -> frozenset[str]:
+    """Get the tags of a wheel, expanding compressed tag sets.
+
+    :param filename: Wheel filename (eg. ``six-1.16.0-py2.py3-none-any.whl``).
+    """
+    if not filename.endswith('.whl'):
+        raise ValueError(f'invalid wheel filename: {filename!r}')
+    parts = filename[:-len('.whl')].split('-')
+    if len(parts) not in (5, 6):
+        raise ValueError(f'invalid wheel filename: {filename!r}')
+    interpreters, abis, platforms = parts[-3:]
+    return frozenset(
+        f'{interpreter}-{abi}-{platform}'
+        for interpreter in interpreters.split('.')
+        for abi in abis.split('.')
+        for platform in platforms.split('.')
+    )
+
+
+@functools.cache
+def _tag_index() -> dict[str, dict[str, int]]:
+    index: dict[str, dict[str, int]] = {}
+    for name in _init._image_names():
+        data = _init.get(name)
+        if TAGS_KEY not in data:
+            continue
+        for rank, tag in enumerate(data[TAGS_KEY]):
+            index.setdefault(tag, {}).setdefault(name, rank)
+    return index
+
+
+def _match_tags(tags: frozenset[str]) -> list[str]:
+    index = _tag_index()
+    ranks: dict[str, int] = {}
+    for tag in tags:
+        for name, rank in index.get(tag, {}).items():
+            if rank < ranks.get(name, rank + 1):
+                ranks[name] = rank
+    return sorted(ranks, key=lambda name: (ranks[name], name))
+
+
+def match(filenames: Iterable[str]) -> dict[str, list[str]]:
+    """Find the images where each wheel can be installed.
+
+    :param filenames: Wheel filenames.
+    :returns: The compatible images of each wheel, best match first (the
+        images where the wheel matches a more preferred tag).
+    """
+    # Many wheels share the same tag set (eg. py3-none-any), so we only match each set once
+    matches = {}
+    results = {}
+    for filename in filenames:
+        tags = wheel_tags(filename)
+        if tags not in matches:
+            matches[tags] = _match_tags(tags)
+        results[filename] = list(matches[tags])
+    return results
@@ -0,0 +1,213 @@
+import json
+import pathlib
+
+import pytest
+
+import containers
+import containers.build
+import containers.manifest
+import containers.ops
+
+
+@pytest.fixture
+def config():
+    return containers.Config.from_config_file(containers.ENVIRONMENTS_TOML_PATH)
+
+
+@pytest.fixture
+def builder(config, tmp_path):
+    images = containers.ImagesContainer(config.images[['debian:12', 'alpine:3.19']])
+    return containers.build.Builder(images, config.repos, tmp_path / 'src', tmp_path / 'logs')
+
+
+def test_generate_data_tasks(builder, tmp_path):
+    tasks = builder.tasks(data_outdir=tmp_path / 'data')
+    by_step = {str(task.userdata): task for task in tasks}
+
+    generate = by_step['generate debian:12']
+    assert generate.dependencies == [by_step['build debian:12']]
+    (command,) = generate.args
+    assert command[command.index('--images') + 1] == 'debian:12'
+    # the per-image runs share the output directory, so they must not write a checkpoint or the bundle
+    assert '--no-checkpoint' in command
+    assert '--no-bundle' in command
+
+    bundle = by_step[f'bundle {tmp_path / "data"}']
+    assert set(bundle.dependencies) == {by_step['generate debian:12'], by_step['generate alpine:3.19']}
+
+
+class FakeDockerClient(containers.ops.DockerClient):
+    def __init__(self):
+        super().__init__()
+        self.digests = {'debian:12': 'sha256:debian', 'alpine:3.19': 'sha256:alpine'}
+        self.images = set()
+        self.inspected = []
+
+    def manifest_digest(self, name):
+        self.inspected.append(name)
+        return self.digests.get(name)
+
+    def image_exists(self, name):
+        return name in self.images
+
+
+@pytest.fixture
+def planner(config, tmp_path):
+    def planner(manifest=True):
+        images = containers.ImagesContainer(config.images[['debian:12', 'alpine:3.19']])
+        builder = containers.build.Builder(
+            images,
+            config.repos,
+            tmp_path / 'src',
+            tmp_path / 'logs',
+            manifest=containers.manifest.BuildManifest(tmp_path / 'manifest.json') if manifest else None,
+        )
+        builder._docker_client = docker
+        return builder
+
+    docker = FakeDockerClient()
+    for name in ('debian:12', 'alpine:3.19'):
+        context = tmp_path / 'src' / name
+        context.mkdir(parents=True)
+        context.joinpath('Dockerfile').write_text(f'FROM {name} AS base\nFROM base\n')
+    planner.docker = docker
+    return planner
+
+
+def actions(decisions):
+    return {image_id: (decision.action, decision.reason) for image_id, decision in decisions.items()}
+
+
+def test_plan(planner, tmp_path):
+    builder = planner()
+    assert actions(builder.plan()) == {
+        'debian:12': ('build', 'no previous build'),
+        'alpine:3.19': ('build', 'no previous build'),
+    }
+    assert sorted(planner.docker.inspected) == ['alpine:3.19', 'debian:12']
+    builder.record([])
+
+    planner.docker.images = {'debian:12', 'alpine:3.19'}
+    assert actions(planner().plan()) == {
+        'debian:12': ('skip', 'unchanged'),
+        'alpine:3.19': ('skip', 'unchanged'),
+    }
+
+    tmp_path.joinpath('src', 'debian:12', 'Dockerfile').write_text('FROM debian:12\nRUN true\n')
+    planner.docker.digests['alpine:3.19'] = 'sha256:new'
+    assert actions(planner().plan()) == {
+        'debian:12': ('build', 'the build context changed'),
+        'alpine:3.19': ('build', 'the base image changed'),
+    }
+
+    del planner.docker.digests['alpine:3.19']
+    planner.docker.images = {'alpine:3.19'}
+    tmp_path.joinpath('src', 'debian:12', 'Dockerfile').write_text('FROM debian:12 AS base\nFROM base\n')
+    assert actions(planner().plan()) == {
+        'debian:12': ('build', 'the previous build is not available locally'),
+        'alpine:3.19': ('build', 'could not resolve the base image digest'),
+    }
+
+
+def test_plan_new_tags(planner, monkeypatch):
+    planner.docker.images = {'debian:12', 'alpine:3.19'}
+    for version in ('0.1.0', '0.1.1', '0.1.2', '0.2.0'):
+        # Each source commit adds a new versioned tag
+        monkeypatch.setattr(containers, '__version__', version)
+        builder = planner()
+        decision = builder.plan()['debian:12']
+        tasks = builder.tasks(push=True)
+        builder.record(tasks)
+
+        if version == '0.1.0':
+            assert decision.action == 'build'
+            continue
+        versioned = [f'debian:12-pc{version}', f'quay.io/python-environments/debian:12-pc{version}']
+        assert (decision.action, decision.reason) == ('tag', 'unchanged, adding 2 new tags')
+        assert list(decision.new_tags) == versioned
+        # The tags of the older versions are not added or pushed again
+        debian_tasks = [str(task.userdata) for task in tasks if 'debian' in task.userdata.target]
+        assert debian_tasks == [f'tag {versioned[0]}', f'tag {versioned[1]}', f'push {versioned[1]}']
+        assert decision.manifest.tags == ['debian:12', versioned[0], 'quay.io/python-environments/debian:12', versioned[1]]
+
+
+def test_plan_force(planner):
+    builder = planner()
+    builder.plan()
+    builder.record([])
+    planner.docker.images = {'debian:12', 'alpine:3.19'}
+
+    assert {decision.action for decision in planner().plan(force=True).values()} == {'build'}
+
+    # Without a manifest, the base images digests are not needed
+    planner.docker.inspected.clear()
+    assert {decision.action for decision in planner(manifest=False).plan(force=True).values()} == {'build'}
+    assert planner.docker.inspected == []
+
+
+def test_push_depends_on_build(builder):
+    tasks = builder.tasks(push=True)
+    build = next(task for task in tasks if str(task.userdata) == 'build debian:12')
+    pushes = [task for task in tasks if task.userdata.action == 'push' and 'debian:12' in task.userdata.target]
+    assert pushes
+    assert all(task.dependencies == [build] for task in pushes)
+
+
+
+def test_bake_definition_matches_build_command(builder):
+    build_commands = {
+        task.userdata.target: task.args[0]
+        for task in builder.tasks()
+        if task.userdata.action == 'build'
+    }
+
+    tasks = builder.tasks(bake=True)
+    assert [str(task.userdata) for task in tasks] == ['bake 2 images']
+    (command,) = tasks[0].args
+    definition = json.loads(pathlib.Path(command[command.index('--file') + 1]).read_text())
+    assert sorted(definition['group']['default']['targets']) == ['alpine-3-19', 'debian-12']
+
+    # Each target builds the image the same way as its own build task
+    for image in builder._images:
+        target = definition['target'][builder._slug(image)]
+        assert target['dockerfile'] == 'Dockerfile'
+        assert builder._docker_client.build_command(
+            pathlib.Path(target['context']),
+            target['tags'],
+            target['labels'],
+            cache_from=target['cache-from'],
+            cache_to=target['cache-to'],
+        ) == build_commands[image.id]
+
+
+def test_build_cache(config, tmp_path):
+    images = containers.ImagesContainer(config.images[['debian:12']])
+    caches = [
+        containers.ops.BuildCache('local', '/cache'),
+        containers.ops.BuildCache('registry', 'localhost:5000/cache'),
+    ]
+    builder = containers.build.Builder(images, config.repos, tmp_path / 'src', tmp_path / 'logs', caches=caches)
+
+    (build,) = [task for task in builder.tasks() if task.userdata.action == 'build']
+    (command,) = build.args
+    assert [arg for arg in command if arg.startswith('--cache-')] == [
+        '--cache-from=type=local,src=/cache/debian-12',
+        '--cache-from=type=registry,ref=localhost:5000/cache:debian-12',
+        '--cache-to=type=local,dest=/cache/debian-12,mode=max',
+        '--cache-to=type=registry,ref=localhost:5000/cache:debian-12,mode=max',
+    ]
+
+    target = builder.bake_definition(images)['target']['debian-12']
+    assert target['cache-from'] == ['type=local,src=/cache/debian-12', 'type=registry,ref=localhost:5000/cache:debian-12']
+    assert target['cache-to'] == [
+        'type=local,dest=/cache/debian-12,mode=max',
+        'type=registry,ref=localhost:5000/cache:debian-12,mode=max',
+    ]
+
+
+def test_duration_keys_are_stable(builder, monkeypatch):
+    def keys(version):
+        monkeypatch.setattr(containers, '__version__', version)
+        return {task.key for task in builder.tasks(push=True)}
+
+    assert keys('0.1.0') == keys('0.1.1')
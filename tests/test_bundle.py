@@ -0,0 +1,58 @@
+import python_environments._bundle
+
+
+DOCUMENTS = {
+    'debian:12': {
+        'metadata': {'manifest': 'sha256:1234'},
+        'data': {
+            'sys.hexversion': 51184624,
+            'sysconfig.get_scheme_names()': ['posix_home', 'posix_prefix'],
+        },
+    },
+    'alpine:3.19': {
+        'metadata': {'manifest': 'sha256:5678'},
+        'data': {
+            'sys.hexversion': 51249392,
+        },
+    },
+}
+
+
+def test_roundtrip(tmp_path):
+    path = tmp_path / python_environments._bundle.FILENAME
+    python_environments._bundle.write(path, DOCUMENTS)
+
+    bundle = python_environments._bundle.Bundle.open(path)
+    assert sorted(bundle.images) == sorted(DOCUMENTS)
+    for name, document in DOCUMENTS.items():
+        assert bundle.metadata(name) == document['metadata']
+        assert dict(bundle.data(name)) == document['data']
+
+
+def test_interpreters(tmp_path):
+    path = tmp_path / python_environments._bundle.FILENAME
+    interpreters = {'/usr/bin/python3.11': {'sys.hexversion': 51184624}}
+    python_environments._bundle.write(path, DOCUMENTS | {
+        'debian:12': DOCUMENTS['debian:12'] | {'interpreters': interpreters},
+    })
+
+    bundle = python_environments._bundle.Bundle.open(path)
+    assert {name: dict(data) for name, data in bundle.interpreters('debian:12').items()} == interpreters
+    assert bundle.interpreters('alpine:3.19') == {}
+
+
+def test_digest_interpreters():
+    data = DOCUMENTS['debian:12']['data']
+    interpreters = {'/usr/bin/python3.11': {'sys.hexversion': 51184624}}
+    # Without other interpreters, the digest is unchanged
+    assert python_environments._bundle.digest(data, {}) == python_environments._bundle.digest(data)
+    assert python_environments._bundle.digest(data, interpreters) != python_environments._bundle.digest(data)
+
+
+def test_lazy_decoding(tmp_path):
+    path = tmp_path / python_environments._bundle.FILENAME
+    python_environments._bundle.write(path, DOCUMENTS)
+
+    data = python_environments._bundle.Bundle.open(path).data('debian:12')
+    assert data['sys.hexversion'] == 51184624
+    assert list(data._values) == ['sys.hexversion']
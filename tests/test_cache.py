@@ -0,0 +1,135 @@
+import gc
+import threading
+import time
+import types
+
+import pytest
+
+import python_environments
+import python_environments._init
+
+
+@pytest.fixture(autouse=True)
+def fake_data(monkeypatch):
+    def read_image_data(name):
+        return {'metadata': {'manifest': f'sha256:{name}'}, 'data': {'name': name}}, 100
+
+    monkeypatch.setattr(python_environments._init, '_read_image_data', read_image_data)
+    monkeypatch.setattr(python_environments._init, '_CACHE', python_environments._init._ImageCache())
+
+
+def test_identity():
+    assert python_environments.get('debian:12') is python_environments.get('debian:12')
+    info = python_environments.cache_info()
+    assert (info.hits, info.misses, info.currsize, info.currbytes) == (1, 1, 1, 100)
+
+
+def test_lru_eviction():
+    python_environments.configure_cache(maxsize=2)
+    debian = python_environments.get('debian:12')
+    python_environments.get('alpine:3.19')
+    python_environments.get('debian:12')
+    python_environments.get('fedora:40')
+
+    assert python_environments.get('debian:12') is debian
+    assert python_environments.cache_info().currsize == 2
+    assert python_environments.cache_info().hits == 2
+
+
+def test_maxbytes():
+    python_environments.configure_cache(maxbytes=250)
+    for name in ('debian:12', 'alpine:3.19', 'fedora:40'):
+        python_environments.get(name)
+    assert python_environments.cache_info().currbytes == 200
+
+
+def test_clear_cache():
+    debian = python_environments.get('debian:12')
+    python_environments.clear_cache()
+    assert python_environments.get('debian:12') is not debian
+
+
+def test_digest_equality():
+    debian = python_environments.get('debian:12')
+    copy = python_environments._init._ImageData('debian:12', {'manifest': 'other'}, {'name': 'debian:12'})
+
+    assert debian.digest.startswith('sha256:')
+    assert debian == copy
+    assert hash(debian) == hash(copy)
+    assert debian != python_environments.get('alpine:3.19')
+    assert debian == {'name': 'debian:12'}
+
+
+def test_concurrent_load(monkeypatch):
+    loads = []
+    read_image_data = python_environments._init._read_image_data
+
+    def slow_read_image_data(name):
+        loads.append(name)
+        time.sleep(0.05)
+        return read_image_data(name)
+
+    monkeypatch.setattr(python_environments._init, '_read_image_data', slow_read_image_data)
+
+    images = []
+    threads = [
+        threading.Thread(target=lambda: images.append(python_environments.get('debian:12')))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == ['debian:12']
+    assert all(image is images[0] for image in images)
+
+
+def test_get_all_intern(monkeypatch):
+    def read_image_data(name):
+        return {'metadata': {'manifest': f'sha256:{name}'}, 'data': {'schemes': ['posix_prefix']}}, 100
+
+    monkeypatch.setattr(python_environments._init, '_read_image_data', read_image_data)
+    monkeypatch.setattr(python_environments._init, '_image_names', lambda: ['debian:12', 'alpine:3.19'])
+    monkeypatch.setattr(python_environments._init, '_INTERNED', {})
+
+    debian = python_environments.get('debian:12')
+    images = python_environments.get_all(intern=True)
+
+    # The cached images are left untouched
+    assert python_environments.get('debian:12') is debian
+    assert debian['schemes'] == ['posix_prefix']
+    assert python_environments.cache_info().currsize == 1
+
+    assert images['debian:12'] == debian
+    assert images['debian:12']['schemes'] == ('posix_prefix',)
+    assert images['debian:12']['schemes'] is images['alpine:3.19']['schemes']
+    assert python_environments.get_all(intern=True)['debian:12'] is images['debian:12']
+
+
+def test_preload(monkeypatch):
+    def read_image_data(name):
+        return {'metadata': {'manifest': f'sha256:{name}'}, 'data': {'schemes': ['posix_prefix'], 'flags': {}}}, 100
+
+    monkeypatch.setattr(python_environments._init, '_read_image_data', read_image_data)
+    monkeypatch.setattr(python_environments._init, '_image_names', lambda: ['debian:12', 'alpine:3.19'])
+    monkeypatch.setattr(python_environments._init, '_INTERNED', {})
+    monkeypatch.setattr(python_environments._init, '_PRELOADED', {})
+    assert python_environments.get('debian:12')['schemes'] == ['posix_prefix']
+
+    try:
+        python_environments.preload()
+        assert gc.isenabled()
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+
+    debian = python_environments.get('debian:12')
+    assert debian is python_environments.get_all(intern=True)['debian:12']
+    # The preloaded images are the interned ones
+    assert debian['schemes'] == ('posix_prefix',)
+    assert isinstance(debian['flags'], types.MappingProxyType)
+    # Pinned, the cache is not used
+    python_environments.clear_cache()
+    assert python_environments.get('debian:12') is debian
+    assert python_environments.cache_info().misses == 1
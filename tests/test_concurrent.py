@@ -0,0 +1,276 @@
+import asyncio
+import json
+import sys
+import threading
+
+import pytest
+
+import containers.concurrent
+
+from containers.concurrent import Task
+
+
+if sys.version_info < (3, 11):
+    from exceptiongroup import ExceptionGroup
+
+
+def noop():
+    pass
+
+
+def fail():
+    raise RuntimeError('failed')
+
+
+def test_dependencies_order():
+    order = []
+    a = Task('a', order.append, ('a',))
+    b = Task('b', order.append, ('b',), dependencies=[a])
+    c = Task('c', order.append, ('c',), dependencies=[a, b])
+
+    results = list(containers.concurrent.run_tasks([c, b, a]))
+
+    assert order == ['a', 'b', 'c']
+    assert [(successful, task.userdata) for successful, task in results] == [(True, 'a'), (True, 'b'), (True, 'c')]
+
+
+def test_skip_dependents_without_fast_fail():
+    release = threading.Event()
+    a = Task('a', fail)
+    b = Task('b', release.wait, (5,))
+    c = Task('c', noop, dependencies=[a])
+    d = Task('d', noop, dependencies=[a, b])  # b completes after a was skipped
+    e = Task('e', noop, dependencies=[c])
+
+    results = {}
+    with pytest.raises(ExceptionGroup):
+        for successful, task in containers.concurrent.run_tasks([a, b, c, d, e], fast_fail=False):
+            results[task.userdata] = successful
+            if task is a:
+                release.set()
+
+    assert results == {'a': False, 'b': True, 'c': False, 'd': False, 'e': False}
+    assert c.duration is d.duration is e.duration is None
+
+
+def test_fast_fail():
+    a = Task('a', fail)
+    b = Task('b', noop, dependencies=[a])
+
+    results = []
+    with pytest.raises(ExceptionGroup):
+        for successful, task in containers.concurrent.run_tasks([a, b]):
+            results.append((successful, task.userdata))
+
+    assert results == [(False, 'a')]
+
+
+def test_invalid_dependencies():
+    a = Task('a', noop)
+    b = Task('b', noop, dependencies=[a])
+    with pytest.raises(ValueError, match='not in the task list'):
+        list(containers.concurrent.run_tasks([b]))
+
+    a.dependencies = [b]
+    with pytest.raises(ValueError, match='cycle'):
+        list(containers.concurrent.run_tasks([a, b]))
+
+
+def completed(userdata, duration, dependencies=(), key=None):
+    task = Task(userdata, noop, dependencies=dependencies, key=key)
+    task.started, task.finished = 0.0, duration
+    return task
+
+
+def test_critical_path():
+    a = completed('a', 3.0)
+    b = completed('b', 1.0)
+    c = completed('c', 1.0, dependencies=[b])
+    d = completed('d', 0.5, dependencies=[a, c])
+    e = completed('e', 2.0, dependencies=[b])
+
+    path, duration = containers.concurrent.critical_path([a, b, c, d, e])
+
+    assert [task.userdata for task in path] == ['a', 'd']
+    assert duration == 3.5
+
+
+def traced(userdata, worker, queued, started, finished, dependencies=()):
+    task = Task(userdata, noop, dependencies=dependencies)
+    task.worker, task.queued, task.started, task.finished = worker, queued, started, finished
+    return task
+
+
+def trace_tasks():
+    # Two workers over 4s: worker 0 is busy for 4s, worker 1 for 2s
+    a = traced('a', 0, 10.0, 10.0, 13.0)
+    b = traced('b', 1, 10.0, 10.5, 11.5)
+    c = traced('c', 1, 10.0, 11.5, 12.5, dependencies=[b])
+    d = traced('d', 0, 12.5, 13.0, 14.0, dependencies=[a, c])
+    return [a, b, c, d, Task('not run', noop)]
+
+
+def test_write_trace(tmp_path):
+    path = tmp_path / 'trace' / 'trace.json'
+    containers.concurrent.write_trace(path, trace_tasks())
+
+    events = json.loads(path.read_text())['traceEvents']
+    assert [event for event in events if event['ph'] == 'M'] == [
+        {'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': 0, 'args': {'name': 'worker 0'}},
+        {'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': 1, 'args': {'name': 'worker 1'}},
+    ]
+    spans = {event['name']: event for event in events if event['ph'] == 'X'}
+    assert set(spans) == {'a', 'b', 'c', 'd'}
+    # In microseconds, relative to the first queued task
+    assert {name: (span['tid'], span['ts'], span['dur']) for name, span in spans.items()} == {
+        'a': (0, 0.0, 3_000_000.0),
+        'b': (1, 500_000.0, 1_000_000.0),
+        'c': (1, 1_500_000.0, 1_000_000.0),
+        'd': (0, 3_000_000.0, 1_000_000.0),
+    }
+    assert spans['d']['args'] == {'queued_us': 2_500_000.0, 'wait_us': 500_000.0, 'dependencies': ['a', 'c']}
+
+
+def test_trace_summary():
+    tasks = trace_tasks()
+
+    assert containers.concurrent.trace_summary(tasks).splitlines() == [
+        'Wall time: 4.00s, busy: 6.00s over 4 tasks',
+        'Workers: 2 of 2 used, utilization: 75%, idle: 2.00s',
+        'Queue wait: mean 0.62s, max 1.50s',
+        '- worker 0: busy 4.00s, idle 0.00s',
+        '- worker 1: busy 2.00s, idle 2.00s',
+    ]
+    assert containers.concurrent.trace_summary(tasks, max_workers=4).splitlines()[1] == (
+        'Workers: 2 of 4 used, utilization: 38%, idle: 10.00s'
+    )
+    assert containers.concurrent.trace_summary([]) == 'No task ran'
+
+    path, duration = containers.concurrent.critical_path(tasks[:4])
+    assert [task.userdata for task in path] == ['a', 'd']
+    assert duration == 4.0
+
+
+def test_critical_path_empty():
+    assert containers.concurrent.critical_path([]) == ([], 0.0)
+
+
+def test_duration_history(tmp_path):
+    path = tmp_path / 'durations.json'
+    history = containers.concurrent.DurationHistory(path)
+    assert not history
+    assert history.expected_duration(Task('a', noop, key='a')) == 0.0
+
+    history.record([
+        completed('a', 2.0, key='a'),
+        completed('c', 4.0, key='c'),
+        completed('no key', 8.0),
+        Task('not run', noop, key='not run'),
+    ])
+
+    history = containers.concurrent.DurationHistory(path)
+    assert history.expected_duration(Task('a', noop, key='a')) == 2.0
+    assert history.expected_duration(Task('c', noop, key='c')) == 4.0
+    # unknown tasks are expected to take the mean duration
+    assert history.expected_duration(Task('new', noop, key='new')) == 3.0
+    assert history.expected_duration(Task('not run', noop, key='not run')) == 3.0
+
+
+def test_predict_makespan():
+    durations = {'long': 4.0, 'short-1': 1.0, 'short-2': 1.0, 'short-3': 1.0, 'after-long': 1.0}
+    long = Task('long', noop)
+    tasks = [
+        Task('short-1', noop),
+        Task('short-2', noop),
+        Task('short-3', noop),
+        long,
+        Task('after-long', noop, dependencies=[long]),
+    ]
+
+    def expected_duration(task):
+        return durations[task.userdata]
+
+    # the long chain is started first, and the short tasks run alongside it
+    assert containers.concurrent.predict_makespan(tasks, expected_duration, max_workers=2) == 5.0
+    assert containers.concurrent.predict_makespan(tasks, expected_duration, max_workers=1) == 8.0
+    assert containers.concurrent.predict_makespan(tasks, expected_duration, max_workers=10) == 5.0
+
+
+def test_longest_expected_first():
+    order = []
+    tasks = [Task(name, order.append, (name,)) for name in ('short', 'long')]
+    durations = {'short': 1.0, 'long': 10.0}
+
+    list(containers.concurrent.run_tasks(
+        tasks,
+        max_workers=1,
+        expected_duration=lambda task: durations[task.userdata],
+    ))
+
+    assert order == ['long', 'short']
+
+
+async def async_noop():
+    pass
+
+
+async def async_fail():
+    raise RuntimeError('failed')
+
+
+async def collect_async(tasks, **kwargs):
+    return [(successful, task.userdata) async for successful, task in containers.concurrent.run_tasks_async(tasks, **kwargs)]
+
+
+def test_async_dependencies_order():
+    order = []
+
+    async def append(name):
+        order.append(name)
+
+    a = Task('a', append, ('a',))
+    b = Task('b', append, ('b',), dependencies=[a])
+    c = Task('c', append, ('c',), dependencies=[a, b])
+
+    results = asyncio.run(collect_async([c, b, a]))
+
+    assert order == ['a', 'b', 'c']
+    assert results == [(True, 'a'), (True, 'b'), (True, 'c')]
+    assert all(task.duration is not None for task in (a, b, c))
+
+
+def test_async_skip_dependents_without_fast_fail():
+    a = Task('a', async_fail)
+    b = Task('b', async_noop)
+    c = Task('c', async_noop, dependencies=[a])
+
+    results = []
+
+    async def main():
+        async for successful, task in containers.concurrent.run_tasks_async([a, b, c], fast_fail=False):
+            results.append((successful, task.userdata))
+
+    with pytest.raises(ExceptionGroup):
+        asyncio.run(main())
+
+    assert sorted(results) == [(False, 'a'), (False, 'c'), (True, 'b')]
+    assert c.duration is None
+
+
+def test_async_fast_fail_cancels_running_tasks():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    a = Task('a', async_fail)
+    b = Task('b', slow)
+
+    with pytest.raises(ExceptionGroup):
+        asyncio.run(collect_async([a, b], max_workers=2))
+
+    assert cancelled == [True]
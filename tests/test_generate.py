@@ -0,0 +1,113 @@
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+import python_environments.generate
+
+
+@pytest.fixture
+def items(monkeypatch):
+    """Replace the introspected items, recording which ones are looked up."""
+    looked_up = []
+
+    def set_items(**lookups):
+        def lookup(item, function):
+            looked_up.append(item)
+            return function()
+
+        monkeypatch.setattr(python_environments.generate, '_items', lambda: [
+            (item, lambda item=item, function=function: lookup(item, function))
+            for item, function in lookups.items()
+        ])
+        return looked_up
+
+    return set_items
+
+
+def test_only_exclude(items):
+    looked_up = items(**{
+        'sys.version': lambda: '3.12',
+        'sys.platform': lambda: 'linux',
+        "sysconfig.get_paths('posix_prefix')": lambda: {},
+        "sysconfig.get_paths('posix_home')": lambda: {},
+    })
+
+    data = python_environments.generate.introspect(
+        only=['sys.*', 'sysconfig.get_paths(*)'],
+        exclude=['sys.platform', "*('posix_home')"],
+    )
+
+    assert data == {'sys.version': '3.12', "sysconfig.get_paths('posix_prefix')": {}}
+    # The filtered out items are never evaluated
+    assert looked_up == ['sys.version', "sysconfig.get_paths('posix_prefix')"]
+
+
+def test_timeout(items):
+    release = threading.Event()
+    items(**{
+        'sys.version': lambda: '3.12',
+        'sys.hangs': lambda: release.wait(30),
+        'sys.platform': lambda: 'linux',
+    })
+
+    try:
+        with pytest.warns(python_environments.generate.LookupWarning, match='sys.hangs: timed out'):
+            data = python_environments.generate.introspect(timeout=0.1)
+    finally:
+        release.set()
+
+    assert data == {'sys.version': '3.12', 'sys.platform': 'linux'}
+
+
+def test_failed_lookup(items):
+    def fail():
+        raise RuntimeError('oops')
+
+    items(**{'sys.version': lambda: '3.12', 'sys.broken': fail, 'sys.platform': lambda: 'linux'})
+
+    with pytest.warns(python_environments.generate.LookupWarning, match='sys.broken: oops'):
+        data = python_environments.generate.introspect()
+
+    # Left out, instead of being stored with the value of the previous item
+    assert data == {'sys.version': '3.12', 'sys.platform': 'linux'}
+
+
+def test_profiler(items):
+    items(**{
+        'sys.fast': lambda: None,
+        'sys.slow': lambda: time.sleep(0.3),
+        'sys.spawn': lambda: subprocess.run([sys.executable, '-c', 'pass'], check=True).returncode,
+        'sys.alloc': lambda: bytearray(1024 * 1024),
+    })
+
+    profiler = python_environments.generate._Profiler()
+    try:
+        python_environments.generate.introspect(profiler)
+    finally:
+        tracemalloc.stop()
+
+    records = profiler.records
+    assert set(records) == {'sys.fast', 'sys.slow', 'sys.spawn', 'sys.alloc'}
+    assert records['sys.slow']['wall_time'] >= 0.3
+    assert records['sys.fast']['subprocesses'] == []
+    assert records['sys.spawn']['subprocesses'] == [f'{sys.executable} -c pass']
+    assert records['sys.alloc']['allocated'] >= 1024 * 1024
+    assert records['sys.alloc']['allocated_peak'] >= records['sys.alloc']['allocated']
+
+    header, *lines = profiler.summary().splitlines()
+    assert header.startswith('profile: 4 items, ')
+    ranked = [line.split()[-1] for line in lines]
+    assert ranked[0] == 'sys.slow'
+    assert ranked == sorted(records, key=lambda item: records[item]['wall_time'], reverse=True)
+    assert '[1 subprocess(es)]' in lines[ranked.index('sys.spawn')]
+    assert len(profiler.summary(limit=2).splitlines()) == 3
+
+
+def test_sys_tags():
+    tags = pytest.importorskip('packaging.tags')
+
+    assert list(python_environments.generate.sys_tags()) == [str(tag) for tag in tags.sys_tags()]
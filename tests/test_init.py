@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import python_environments._init
+
+
+def test_image_names_skip_hidden_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(python_environments._init, '_get_data_dir', lambda: tmp_path)
+    monkeypatch.setattr(python_environments._init, '_get_bundle', lambda: None)
+    document = {'metadata': {'manifest': 'sha256:1234'}, 'data': {}}
+    tmp_path.joinpath('debian:12.json').write_text(json.dumps(document))
+    tmp_path.joinpath('.generate-data-checkpoint.json').write_text('{"generator": "", "completed": []}')
+    tmp_path.joinpath('.debian:12.json.1234.tmp').write_text('')
+
+    assert python_environments._init._image_names() == ['debian:12']
+
+
+FAKE_GENERATE_DATA_SCRIPT = '''
+import argparse
+import pathlib
+import sys
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--outdir', type=pathlib.Path)
+args = parser.parse_args()
+runs = pathlib.Path(__file__).with_name('runs')
+runs.write_text(str(int(runs.read_text()) + 1) if runs.exists() else '1')
+args.outdir.joinpath('debian:12.json').write_text('{}')
+if pathlib.Path(__file__).with_name('fail').exists():
+    sys.exit(1)
+'''
+
+
+@pytest.fixture
+def srcdir(tmp_path, monkeypatch):
+    monkeypatch.delenv('PYTHON_ENVIRONMENTS_CACHE_DIR', raising=False)
+    monkeypatch.setenv('XDG_CACHE_HOME', os.fspath(tmp_path / 'cache'))
+    rootdir = tmp_path / 'src'
+    srcdir = rootdir / 'python'
+    srcdir.joinpath('python_environments').mkdir(parents=True)
+    srcdir.joinpath('python_environments', 'generate.py').write_text('')
+    srcdir.joinpath('generate-data.py').write_text(FAKE_GENERATE_DATA_SCRIPT)
+    rootdir.joinpath('containers', 'templates').mkdir(parents=True)
+    rootdir.joinpath('containers', 'templates', 'Dockerfile.j2').write_text('FROM {{ image }}\n')
+    rootdir.joinpath('environments.toml').write_text('')
+    return srcdir
+
+
+def runs(srcdir):
+    return int(srcdir.joinpath('runs').read_text())
+
+
+def test_generate_data_cache(srcdir, tmp_path):
+    with pytest.warns(UserWarning, match='generating it'):
+        datadir = python_environments._init._generate_data(srcdir)
+    assert datadir == srcdir / '.data'
+    assert runs(srcdir) == 1
+    cachedir = tmp_path / 'cache' / 'python-environments' / 'data' / python_environments._init._source_data_key(srcdir)
+    assert cachedir.joinpath('debian:12.json').is_file()
+
+    # A fresh checkout of the same sources uses the cached data
+    shutil.rmtree(datadir)
+    assert python_environments._init._generate_data(srcdir) == datadir
+    assert datadir.joinpath('debian:12.json').is_file()
+    assert runs(srcdir) == 1
+
+    # The data is generated again when its inputs change
+    shutil.rmtree(datadir)
+    srcdir.parent.joinpath('containers', 'templates', 'Dockerfile.j2').write_text('FROM {{ image }}\nRUN true\n')
+    with pytest.warns(UserWarning):
+        python_environments._init._generate_data(srcdir)
+    assert runs(srcdir) == 2
+    assert len(list(cachedir.parent.iterdir())) == 2
+
+
+def test_generate_data_failure(srcdir, tmp_path):
+    srcdir.joinpath('fail').touch()
+
+    with pytest.warns(UserWarning), pytest.raises(subprocess.CalledProcessError):
+        python_environments._init._generate_data(srcdir)
+
+    assert not srcdir.joinpath('.data').exists()
+    assert not tmp_path.joinpath('cache', 'python-environments', 'data').exists()
+
+
+def test_get_reads_only_the_requested_image(tmp_path, monkeypatch):
+    monkeypatch.setattr(python_environments._init, '_get_data_dir', lambda: tmp_path)
+    monkeypatch.setattr(python_environments._init, '_get_bundle', lambda: None)
+    monkeypatch.setattr(python_environments._init, '_CACHE', python_environments._init._ImageCache())
+    document = {'metadata': {'manifest': 'sha256:1234'}, 'data': {'sys.hexversion': 51184624}}
+    tmp_path.joinpath('debian:12.json').write_text(json.dumps(document))
+    tmp_path.joinpath('alpine:3.19.json').write_text('{"metadata": ')
+    tmp_path.joinpath('fedora:40.json').mkdir()
+
+    assert python_environments._init.get('debian:12')['sys.hexversion'] == 51184624
+    with pytest.raises(json.JSONDecodeError):
+        python_environments._init.get('alpine:3.19')
@@ -0,0 +1,21 @@
+import types
+
+import python_environments._intern
+
+
+def test_shared_values():
+    interner = python_environments._intern.Interner()
+    a = interner.intern({'flags': {'optimize': 0}, 'schemes': ['posix_home', 'posix_prefix']})
+    b = interner.intern({'flags': {'optimize': 0}, 'schemes': ['posix_home', 'posix_prefix']})
+
+    assert a is b
+    assert isinstance(a, types.MappingProxyType)
+    assert a['schemes'] == ('posix_home', 'posix_prefix')
+    assert interner.info().hits > 0
+    assert interner.info().saved_bytes > 0
+
+
+def test_types_kept_apart():
+    interner = python_environments._intern.Interner()
+    assert interner.intern([1]) is not interner.intern([True])
+    assert interner.intern([1.0]) is not interner.intern([1])
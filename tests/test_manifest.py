@@ -0,0 +1,43 @@
+import containers.manifest
+
+
+def test_base_images(tmp_path):
+    dockerfile = tmp_path / 'Dockerfile'
+    dockerfile.write_text(
+        'FROM --platform=$BUILDPLATFORM debian:12 AS builder\n'
+        'RUN make\n'
+        'from builder as test\n'
+        'FROM scratch\n'
+        'COPY --from=builder /out /\n'
+        'FROM debian:12\n'
+        'FROM alpine:3.19\n'
+    )
+
+    assert containers.manifest.base_images(dockerfile) == ['debian:12', 'alpine:3.19']
+
+
+def test_context_digest(tmp_path):
+    def context(name, files):
+        path = tmp_path / name
+        for file, content in files.items():
+            path.joinpath(file).parent.mkdir(exist_ok=True, parents=True)
+            path.joinpath(file).write_text(content)
+        return containers.manifest.context_digest(path)
+
+    digest = context('a', {'Dockerfile': 'FROM debian:12\n', 'files/setup.sh': 'true\n'})
+
+    assert digest.startswith('sha256:')
+    assert context('same', {'files/setup.sh': 'true\n', 'Dockerfile': 'FROM debian:12\n'}) == digest
+    assert context('content', {'Dockerfile': 'FROM debian:12\n', 'files/setup.sh': 'false\n'}) != digest
+    assert context('renamed', {'Dockerfile': 'FROM debian:12\n', 'files/install.sh': 'true\n'}) != digest
+
+
+def test_build_manifest(tmp_path):
+    path = tmp_path / 'manifest.json'
+    manifest = containers.manifest.BuildManifest(path)
+    image = containers.manifest.ImageManifest('sha256:1234', {'debian:12': 'sha256:5678'}, {}, ['debian:12'])
+    manifest.record('debian:12', image)
+    manifest.save()
+
+    assert containers.manifest.BuildManifest(path).get('debian:12') == image
+    assert containers.manifest.BuildManifest(path).get('alpine:3.19') is None
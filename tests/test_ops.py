@@ -0,0 +1,134 @@
+import asyncio
+import os
+import pathlib
+import subprocess
+import sys
+import time
+
+import pytest
+
+import containers.ops
+
+
+def python_command(code):
+    return [sys.executable, '-c', code]
+
+
+def is_running(pid):
+    # A killed process stays around as a zombie until its parent reaps it
+    try:
+        stat = pathlib.Path(f'/proc/{pid}/stat').read_text()
+    except FileNotFoundError:
+        return False
+    return stat.rpartition(')')[2].split()[0] != 'Z'
+
+
+def test_runner(tmp_path):
+    logfile = tmp_path / 'logs' / 'task.log'
+    run = containers.ops.logging_subprocess_runner(logfile, tail_lines=2)
+
+    output = run(python_command('print(1); print(2); print(3)'))
+
+    assert output == b'2\n3\n'
+    assert logfile.read_bytes().endswith(b'1\n2\n3\n')
+
+
+def test_runner_failure(tmp_path):
+    run = containers.ops.logging_subprocess_runner(tmp_path / 'task.log', tail_lines=2)
+
+    with pytest.raises(subprocess.CalledProcessError) as excinfo:
+        run(python_command('print(1); print(2); print("oops"); raise SystemExit(3)'))
+
+    assert excinfo.value.returncode == 3
+    assert excinfo.value.output == b'2\noops\n'
+
+
+def test_runner_long_line(tmp_path):
+    logfile = tmp_path / 'task.log'
+    run = containers.ops.logging_subprocess_runner(logfile, tail_lines=1)
+    length = containers.ops.MAX_LINE_LENGTH * 2 + 10
+
+    output = run(python_command(f'print("x" * {length}, end="")'))
+
+    # The tail is bounded by whole chunks, the log has the whole line
+    assert output == b'x' * 10
+    assert logfile.read_bytes().endswith(b'x' * length + b'\n')
+
+
+def test_async_runner(tmp_path):
+    logfile = tmp_path / 'logs' / 'task.log'
+    run = containers.ops.logging_async_subprocess_runner(logfile, tail_lines=2)
+
+    output = asyncio.run(run(python_command('print(1); print(2); print(3)')))
+
+    assert output == b'2\n3\n'
+    assert logfile.read_bytes().endswith(b'1\n2\n3\n')
+
+
+def test_async_runner_failure(tmp_path):
+    run = containers.ops.logging_async_subprocess_runner(tmp_path / 'task.log')
+
+    with pytest.raises(subprocess.CalledProcessError) as excinfo:
+        asyncio.run(run(python_command('print("oops"); raise SystemExit(3)')))
+
+    assert excinfo.value.returncode == 3
+    assert excinfo.value.output == b'oops\n'
+
+
+def test_async_runner_long_line(tmp_path):
+    logfile = tmp_path / 'task.log'
+    run = containers.ops.logging_async_subprocess_runner(logfile)
+    length = containers.ops.MAX_LINE_LENGTH * 2 + 10
+
+    asyncio.run(run(python_command(f'print("x" * {length}); print("end")')))
+
+    assert logfile.read_bytes().endswith(b'x' * length + b'\nend\n')
+
+
+def test_async_runner_cancel(tmp_path):
+    pidfile = tmp_path / 'pid'
+    run = containers.ops.logging_async_subprocess_runner(tmp_path / 'task.log', terminate_timeout=1.0)
+    # The child ignores SIGTERM, so it has to be killed along with its process group
+    command = ['sh', '-c', f'sh -c \'trap "" TERM; sleep 30\' & echo $! > {pidfile}; wait']
+
+    async def main():
+        task = asyncio.ensure_future(run(command))
+        while not pidfile.is_file() or not pidfile.read_text():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    start = time.perf_counter()
+    asyncio.run(main())
+
+    assert time.perf_counter() - start < 10
+    pid = int(pidfile.read_text())
+    for _ in range(100):
+        if not is_running(pid):
+            break
+        time.sleep(0.01)
+    assert not is_running(pid)
+    assert (tmp_path / 'task.log').read_bytes().endswith(b'(cancelled)\n')
+
+
+def test_build_cache():
+    local = containers.ops.BuildCache('local', '/var/cache/buildkit')
+    assert local.cache_from('debian-12') == 'type=local,src=/var/cache/buildkit/debian-12'
+    assert local.cache_to('debian-12') == 'type=local,dest=/var/cache/buildkit/debian-12,mode=max'
+
+    registry = containers.ops.BuildCache('registry', 'localhost:5000/cache')
+    assert registry.cache_from('debian-12') == 'type=registry,ref=localhost:5000/cache:debian-12'
+    assert registry.cache_to('debian-12') == 'type=registry,ref=localhost:5000/cache:debian-12,mode=max'
+
+
+def test_build_command_cache():
+    docker = containers.ops.DockerClient()
+    command = docker.build_command(
+        pathlib.Path('src'),
+        ['debian:12'],
+        {},
+        cache_from=['type=local,src=/cache'],
+        cache_to=['type=local,dest=/cache,mode=max'],
+    )
+    assert command[-2:] == ['--cache-from=type=local,src=/cache', '--cache-to=type=local,dest=/cache,mode=max']
@@ -0,0 +1,134 @@
+import json
+import os
+import pathlib
+import stat
+import subprocess
+import sys
+
+import python_environments._bundle
+
+
+GENERATE_DATA_SCRIPT = pathlib.Path(__file__).parents[1] / 'python' / 'generate-data.py'
+
+
+def test_local_backend(tmp_path):
+    subprocess.run(
+        [
+            sys.executable, GENERATE_DATA_SCRIPT,
+            '--backend', 'local',
+            '--interpreter', f'local={sys.executable}',
+            '--outdir', tmp_path,
+        ],
+        check=True,
+    )
+
+    bundle = python_environments._bundle.Bundle.open(tmp_path / python_environments._bundle.FILENAME)
+    assert bundle.images == ['local']
+    data = bundle.data('local')
+    assert data['sys.hexversion'] == sys.hexversion
+    assert bundle.metadata('local')['digest'] == python_environments._bundle.digest(data)
+
+
+def test_all_interpreters(tmp_path):
+    # A bare interpreter name, resolved through PATH
+    path = os.pathsep.join([os.path.dirname(sys.executable), os.environ['PATH']])
+    subprocess.run(
+        [
+            sys.executable, GENERATE_DATA_SCRIPT,
+            '--backend', 'local',
+            '--interpreter', f'local={os.path.basename(sys.executable)}',
+            '--all-interpreters',
+            '--outdir', tmp_path,
+        ],
+        env=os.environ | {'PATH': path},
+        check=True,
+    )
+
+    bundle = python_environments._bundle.Bundle.open(tmp_path / python_environments._bundle.FILENAME)
+    data = bundle.data('local')
+    interpreters = bundle.interpreters('local')
+    assert data['sys.hexversion'] == sys.hexversion
+    assert interpreters
+    assert bundle.metadata('local')['digest'] == python_environments._bundle.digest(data, interpreters)
+
+
+def test_file_mode(tmp_path):
+    subprocess.run(
+        [sys.executable, GENERATE_DATA_SCRIPT, '--backend', 'local', '--outdir', tmp_path],
+        check=True,
+    )
+
+    umask = os.umask(0)
+    os.umask(umask)
+    for name in ('local.json', python_environments._bundle.FILENAME):
+        assert stat.S_IMODE(tmp_path.joinpath(name).stat().st_mode) == 0o666 & ~umask
+
+
+def generate_data(outdir, *args, check=True):
+    return subprocess.run(
+        [sys.executable, GENERATE_DATA_SCRIPT, '--backend', 'local', '--outdir', outdir, *args],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=check,
+    )
+
+
+def test_bundle_keeps_other_images(tmp_path):
+    generate_data(tmp_path, '--interpreter', f'a={sys.executable}', '--interpreter', f'b={sys.executable}')
+    generate_data(tmp_path, '--interpreter', f'b={sys.executable}')
+
+    bundle = python_environments._bundle.Bundle.open(tmp_path / python_environments._bundle.FILENAME)
+    assert bundle.images == ['a', 'b']
+    assert bundle.data('a')['sys.hexversion'] == sys.hexversion
+
+
+def test_incremental(tmp_path):
+    generate_data(tmp_path)
+    data = tmp_path / 'local.json'
+    mtime = data.stat().st_mtime_ns
+
+    output = generate_data(tmp_path, '--incremental').stdout
+    assert '- up to date: local' in output
+    assert data.stat().st_mtime_ns == mtime
+
+    # Eg. truncated by an interrupted run
+    data.write_text(data.read_text()[:100])
+    output = generate_data(tmp_path, '--incremental').stdout
+    assert '- outdated: local' in output
+    bundle = python_environments._bundle.Bundle.open(tmp_path / python_environments._bundle.FILENAME)
+    assert bundle.data('local')['sys.hexversion'] == sys.hexversion
+
+
+def test_jobs(tmp_path):
+    generate_data(tmp_path, '--jobs', '2', '--interpreter', f'a={sys.executable}', '--interpreter', f'b={sys.executable}')
+
+    bundle = python_environments._bundle.Bundle.open(tmp_path / python_environments._bundle.FILENAME)
+    assert bundle.images == ['a', 'b']
+    assert bundle.data('a')['sys.hexversion'] == bundle.data('b')['sys.hexversion'] == sys.hexversion
+
+
+def test_resume(tmp_path):
+    checkpoint = tmp_path / '.generate-data-checkpoint'
+    # The tasks run in order with a single job, so 'ok' is generated before 'broken' fails
+    failed = generate_data(
+        tmp_path, '--jobs', '1', '--interpreter', f'ok={sys.executable}', '--interpreter', 'broken=/nonexistent',
+        check=False,
+    )
+    assert failed.returncode != 0
+    state = checkpoint.read_text()
+    assert json.loads(state)['completed'] == ['ok']
+    mtime = (tmp_path / 'ok.json').stat().st_mtime_ns
+
+    output = generate_data(
+        tmp_path, '--resume', '--interpreter', f'ok={sys.executable}', '--interpreter', f'broken={sys.executable}',
+    ).stdout
+    assert 'Resuming, 1 images were already generated' in output
+    assert '- generated data for ok' not in output
+    assert '- generated data for broken' in output
+    assert (tmp_path / 'ok.json').stat().st_mtime_ns == mtime
+    assert not checkpoint.exists()
+
+    # Without --resume, the checkpoint of the previous run is ignored
+    checkpoint.write_text(state)
+    output = generate_data(tmp_path, '--interpreter', f'ok={sys.executable}').stdout
+    assert '- generated data for ok' in output
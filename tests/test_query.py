@@ -0,0 +1,82 @@
+import pytest
+
+import python_environments._init
+import python_environments.query as query
+
+
+IMAGES = {
+    'debian:12': {
+        'sys.hexversion': 0x030b02f0,
+        'sys.flags.optimize': 0,
+        'sysconfig.get_platform()': 'linux-x86_64',
+        'sys.implementation.version': [3, 11, 2],
+        'sysconfig.get_config_vars()': {'Py_DEBUG': 0},
+    },
+    'alpine:3.19': {
+        'sys.hexversion': 0x030b06f0,
+        'sys.flags.optimize': False,
+        'sysconfig.get_platform()': 'linux-aarch64',
+        'sys.implementation.version': [3, 11, 6],
+        'sysconfig.get_config_vars()': {'Py_DEBUG': False},
+    },
+    'fedora:40': {
+        'sys.hexversion': 0x030c03f0,
+        'sys.flags.optimize': 0.0,
+        'sysconfig.get_platform()': 'linux-x86_64',
+        'sys.implementation.version': [3, 12, 3],
+    },
+}
+
+
+@pytest.fixture(autouse=True)
+def fake_data(monkeypatch):
+    def read_image_data(name):
+        return {'metadata': {'manifest': f'sha256:{name}'}, 'data': IMAGES[name]}, 100
+
+    monkeypatch.setattr(python_environments._init, '_read_image_data', read_image_data)
+    monkeypatch.setattr(python_environments._init, '_image_names', lambda: sorted(IMAGES))
+    monkeypatch.setattr(python_environments._init, '_CACHE', python_environments._init._ImageCache())
+    for index in (query._value_index, query._range_index, query.images):
+        index.cache_clear()
+    yield
+    for index in (query._value_index, query._range_index, query.images):
+        index.cache_clear()
+
+
+def test_images():
+    assert query.images() == {'debian:12', 'alpine:3.19', 'fedora:40'}
+
+
+def test_where():
+    assert query.where('sysconfig.get_platform()', 'linux-x86_64') == {'debian:12', 'fedora:40'}
+    assert query.where('sysconfig.get_platform()', 'win32') == frozenset()
+    assert query.where('unknown', 'linux-x86_64') == frozenset()
+
+
+def test_where_containers():
+    assert query.where('sys.implementation.version', [3, 11, 2]) == {'debian:12'}
+    assert query.where('sys.implementation.version', (3, 11, 2)) == {'debian:12'}
+    assert query.where('sysconfig.get_config_vars()', {'Py_DEBUG': 0}) == {'debian:12'}
+    assert query.where('sysconfig.get_config_vars()', [('Py_DEBUG', 0)]) == frozenset()
+
+
+def test_where_types():
+    assert query.where('sys.flags.optimize', 0) == {'debian:12'}
+    assert query.where('sys.flags.optimize', False) == {'alpine:3.19'}
+    assert query.where('sys.flags.optimize', 0.0) == {'fedora:40'}
+    assert query.where('sysconfig.get_config_vars()', {'Py_DEBUG': False}) == {'alpine:3.19'}
+
+
+def test_between():
+    assert query.between('sys.hexversion', 0x030b0000, 0x030c0000) == {'debian:12', 'alpine:3.19'}
+    assert query.between('sys.hexversion', 0x030c0000) == {'fedora:40'}
+    assert query.between('sys.hexversion', stop=0x030b06f0) == {'debian:12'}
+    # Booleans are not numbers here
+    assert query.between('sys.flags.optimize', 0, 1) == {'debian:12', 'fedora:40'}
+
+
+def test_combined():
+    x86_64 = query.where('sysconfig.get_platform()', 'linux-x86_64')
+    py311 = query.between('sys.hexversion', 0x030b0000, 0x030c0000)
+    assert x86_64 & py311 == {'debian:12'}
+    assert query.images() - x86_64 == {'alpine:3.19'}
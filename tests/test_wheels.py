@@ -0,0 +1,40 @@
+import pytest
+
+import python_environments.wheels
+
+
+def test_wheel_tags():
+    assert python_environments.wheels.wheel_tags('six-1.16.0-py2.py3-none-any.whl') == {
+        'py2-none-any',
+        'py3-none-any',
+    }
+    assert python_environments.wheels.wheel_tags('foo-1.0-1-cp312-abi3-linux_x86_64.whl') == {
+        'cp312-abi3-linux_x86_64',
+    }
+
+
+@pytest.mark.parametrize('filename', ['six-1.16.0.tar.gz', 'six-py3-none-any.whl'])
+def test_wheel_tags_invalid(filename):
+    with pytest.raises(ValueError):
+        python_environments.wheels.wheel_tags(filename)
+
+
+def test_match(monkeypatch):
+    data = {
+        'debian:12': ['cp311-cp311-linux_x86_64', 'py3-none-any'],
+        'alpine:3.19': ['cp312-cp312-linux_x86_64', 'cp312-abi3-linux_x86_64', 'py3-none-any'],
+    }
+    monkeypatch.setattr(python_environments._init, '_image_names', lambda: list(data))
+    monkeypatch.setattr(python_environments._init, 'get', lambda name: {python_environments.wheels.TAGS_KEY: data[name]})
+    python_environments.wheels._tag_index.cache_clear()
+
+    assert python_environments.wheels.match([
+        'six-1.16.0-py2.py3-none-any.whl',
+        'foo-1.0-cp311-cp311-linux_x86_64.whl',
+        'bar-1.0-cp312-abi3-linux_x86_64.whl',
+    ]) == {
+        'six-1.16.0-py2.py3-none-any.whl': ['debian:12', 'alpine:3.19'],
+        'foo-1.0-cp311-cp311-linux_x86_64.whl': ['debian:12'],
+        'bar-1.0-cp312-abi3-linux_x86_64.whl': ['alpine:3.19'],
+    }
+    python_environments.wheels._tag_index.cache_clear()